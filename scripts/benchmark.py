@@ -0,0 +1,211 @@
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime
+from mock_api_server import MockApiData, start_mock_api_server
+from petitions_parser import PetitionsParser
+from comments_parser import CommentsParser
+from signers_parser import SignersParser
+from record_files import RECORD_FILE_FORMATS, find_record_files, iterate_records
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def count_records(prefix):
+    """
+    Подсчет записей во всех файлах записей с префиксом
+
+    Arguments:
+    prefix -- префикс имени файлов: petitions, comments, signers
+    """
+    return sum(1 for record_file_name in find_record_files(prefix)
+               for _ in iterate_records(record_file_name))
+
+
+def run_stage(name, server, run):
+    """
+    Выполнение этапа бенчмарка и измерение времени, количества запросов
+    к серверу и обработанных записей
+
+    Arguments:
+    name -- название этапа
+    server -- сервер API (MockApiServer)
+    run -- функция этапа, возвращает количество обработанных записей
+    """
+    requests_before = sum(server.get_requests_count().values())
+    start = time.perf_counter()
+    records = run()
+    wall_time = time.perf_counter() - start
+    requests = sum(server.get_requests_count().values()) - requests_before
+    return {"stage": name, "wallTime": wall_time, "requests": requests,
+            "requestsPerSecond": requests / wall_time, "records": records,
+            "recordsPerSecond": records / wall_time}
+
+
+def run_parser(parser, prefix, file_format):
+    """
+    Парсинг в новый файл записей, возвращает количество полученных записей
+
+    Arguments:
+    parser -- парсер (PetitionsParser, CommentsParser, SignersParser)
+    prefix -- префикс имени файла записей
+    file_format -- формат файла записей
+    """
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    parser.run(f"{prefix}_{timestamp}.{file_format}")
+    return count_records(prefix)
+
+
+def run_loaders(dsn, server):
+    """
+    Загрузка файлов записей, полученных парсерами, в базу данных.
+    Возвращает list результатов этапов
+
+    Arguments:
+    dsn -- строка подключения к тестовой базе данных
+    server -- сервер API (MockApiServer)
+    """
+    import psycopg2
+    from petitions_database_loader import PetitionsDatabaseLoader
+    from comments_database_loader import CommentsDatabaseLoader
+    from signers_database_loader import SignersDatabaseLoader
+
+    shutil.copy(os.path.join(SCRIPTS_DIR, "init_database.sql"), "init_database.sql")
+    conn = psycopg2.connect(dsn)
+    try:
+        results = []
+        for prefix, create_loader, load in (
+                ("petitions", PetitionsDatabaseLoader, lambda loader: loader.load_petitions()),
+                ("comments", CommentsDatabaseLoader, lambda loader: loader.load_comments()),
+                ("signers", SignersDatabaseLoader, lambda loader: loader.load_signers())):
+            records = count_records(prefix)
+            loader = create_loader(conn)
+
+            def run():
+                load(loader)
+                return records
+            results.append(run_stage(f"{prefix} loader", server, run))
+        return results
+    finally:
+        conn.close()
+
+
+def run_benchmark(data, faults, dsn=None, workers=8, processes=1, file_format="csv"):
+    """
+    Запуск парсеров против локального сервера API и, если задана база данных,
+    загрузчиков. Парсеры работают во временной директории. Возвращает list
+    результатов этапов
+
+    Arguments:
+    data -- синтетические данные (MockApiData)
+    faults -- dict параметров задержек и ошибок сервера (MockApiServer)
+    dsn -- строка подключения к тестовой базе данных, None - без загрузчиков
+    workers -- количество одновременных запросов петиций
+    processes -- количество процессов парсера подписей
+    file_format -- формат файлов записей
+    """
+    server = start_mock_api_server(data, **faults)
+    api_url = server.get_api_url()
+    cwd = os.getcwd()
+    work_dir = tempfile.mkdtemp(prefix="benchmark_")
+    os.chdir(work_dir)
+    try:
+        results = [
+            run_stage("petitions parser", server,
+                      lambda: run_parser(PetitionsParser(api_url, workers=workers), "petitions", file_format)),
+            run_stage("comments parser", server,
+                      lambda: run_parser(CommentsParser(api_url), "comments", file_format)),
+            run_stage("signers parser", server,
+                      lambda: run_parser(SignersParser(api_url, processes=processes), "signers", file_format)),
+        ]
+        if dsn is not None:
+            results.extend(run_loaders(dsn, server))
+        return results
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(work_dir, ignore_errors=True)
+        server.shutdown()
+        server.server_close()
+
+
+def find_regressions(results, baseline, tolerance):
+    """
+    Поиск этапов, скорость обработки записей которых упала относительно
+    сохраненных результатов больше, чем на tolerance
+
+    Arguments:
+    results -- list результатов этапов
+    baseline -- list сохраненных результатов этапов
+    tolerance -- допустимое относительное падение скорости
+    """
+    baseline_speeds = {f["stage"]: f["recordsPerSecond"] for f in baseline}
+    return [(f["stage"], baseline_speeds[f["stage"]], f["recordsPerSecond"])
+            for f in results
+            if f["stage"] in baseline_speeds
+            and f["recordsPerSecond"] < baseline_speeds[f["stage"]] * (1 - tolerance)]
+
+
+def print_results(results):
+    """
+    Вывод результатов этапов таблицей
+
+    Arguments:
+    results -- list результатов этапов
+    """
+    print(f"{'stage':<18}{'wall time, s':>14}{'requests':>10}{'requests/s':>12}{'records':>10}{'records/s':>12}")
+    for f in results:
+        print(f"{f['stage']:<18}{f['wallTime']:>14.2f}{f['requests']:>10}{f['requestsPerSecond']:>12.1f}"
+              f"{f['records']:>10}{f['recordsPerSecond']:>12.1f}")
+
+if __name__ == "__main__":
+    import argparse
+    arg_parser = argparse.ArgumentParser(prog="benchmark")
+    arg_parser.add_argument("--petitions", type=int, default=100, help="количество петиций")
+    arg_parser.add_argument("--max-signers", type=int, default=1000,
+                            help="максимальное количество подписей одной петиции")
+    arg_parser.add_argument("--max-comments", type=int, default=50,
+                            help="максимальное количество комментариев одной петиции")
+    arg_parser.add_argument("--cover-size", type=int, default=64 * 1024,
+                            help="размер файла обложки петиции в байтах")
+    arg_parser.add_argument("--bad-signers-rate", type=float, default=0.0,
+                            help="доля петиций со сбойной подписью (ошибка 500)")
+    arg_parser.add_argument("--latency", type=float, default=0.0, help="средняя задержка ответа в секундах")
+    arg_parser.add_argument("--error-rate", type=float, default=0.0, help="доля ответов 503")
+    arg_parser.add_argument("--timeout-rate", type=float, default=0.0, help="доля зависающих запросов")
+    arg_parser.add_argument("--timeout-delay", type=float, default=30.0,
+                            help="задержка зависающих запросов в секундах")
+    arg_parser.add_argument("--seed", type=int, default=0)
+    arg_parser.add_argument("-w", "--workers", type=int, default=8,
+                            help="количество одновременных запросов петиций")
+    arg_parser.add_argument("-p", "--processes", type=int, default=1,
+                            help="количество процессов парсера подписей")
+    arg_parser.add_argument("--format", choices=RECORD_FILE_FORMATS, default="csv",
+                            help="формат файлов записей")
+    arg_parser.add_argument("--dsn", help="строка подключения к тестовой базе данных для загрузчиков, "
+                                          "данные петиций в ней перезаписываются")
+    arg_parser.add_argument("-o", "--output", help="JSON файл для сохранения результатов")
+    arg_parser.add_argument("--baseline", help="JSON файл сохраненных результатов для сравнения")
+    arg_parser.add_argument("--tolerance", type=float, default=0.2,
+                            help="допустимое относительное падение records/s относительно --baseline")
+    args = arg_parser.parse_args()
+
+    data = MockApiData(args.petitions, args.max_signers, args.max_comments, args.cover_size,
+                       args.bad_signers_rate, args.seed)
+    faults = {"latency": args.latency, "error_rate": args.error_rate,
+              "timeout_rate": args.timeout_rate, "timeout_delay": args.timeout_delay}
+    results = run_benchmark(data, faults, dsn=args.dsn, workers=args.workers,
+                            processes=args.processes, file_format=args.format)
+    print_results(results)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = find_regressions(results, json.load(f), args.tolerance)
+        for stage, baseline_speed, speed in regressions:
+            print(f"{stage}: {speed:.1f} records/s, baseline {baseline_speed:.1f} records/s")
+        if regressions:
+            sys.exit(1)
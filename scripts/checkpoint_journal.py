@@ -0,0 +1,105 @@
+import json
+import os
+import time
+import errno
+
+def silent_remove(filename):
+    try:
+        os.remove(filename)
+    except OSError as e:
+        if e.errno != errno.ENOENT:
+            raise
+
+def get_file_size(filename):
+    """
+    Получение размера файла, 0 если файла нет
+
+    Arguments:
+    filename -- путь к файлу
+    """
+    try:
+        return os.path.getsize(filename)
+    except OSError:
+        return 0
+
+def truncate_file(filename, size):
+    """
+    Обрезка файла до размера, записанного в контрольной точке.
+    Возвращает False, если файл отсутствует или короче этого размера
+
+    Arguments:
+    filename -- путь к файлу
+    size -- размер файла в байтах
+    """
+    try:
+        if os.path.getsize(filename) < size:
+            return False
+    except OSError:
+        return size == 0
+    with open(filename, "r+b") as f:
+        f.truncate(size)
+    return True
+
+
+class CheckpointJournal:
+    def __init__(self, path, interval=5):
+        """
+        Инициализация журнала контрольных точек парсинга
+
+        Arguments:
+        path -- путь к JSON файлу журнала
+        interval -- минимальный интервал между контрольными точками в секундах
+        """
+        self.path = path
+        self.interval = interval
+        self.last_save_time = time.monotonic()
+
+
+    def load(self):
+        """
+        Чтение последней контрольной точки, None если журнала нет
+        """
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+
+    def save(self, state):
+        """
+        Запись контрольной точки
+
+        Arguments:
+        state -- dict состояния парсинга
+        """
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+        self.last_save_time = time.monotonic()
+
+
+    def is_due(self):
+        """
+        Проверка, что с прошлой контрольной точки прошло не меньше interval секунд
+        """
+        return time.monotonic() - self.last_save_time >= self.interval
+
+
+    def checkpoint(self, state):
+        """
+        Запись контрольной точки, если с прошлой записи прошло не меньше interval секунд
+
+        Arguments:
+        state -- dict состояния парсинга
+        """
+        if self.is_due():
+            self.save(state)
+
+
+    def clear(self):
+        """
+        Удаление журнала после успешного завершения парсинга
+        """
+        silent_remove(self.path)
@@ -1,11 +1,15 @@
-import requests
 import json
-import csv
 from datetime import datetime
 from datetime import timedelta
 import os
 import itertools
 import errno
+from http_client import HttpClient, parse_concurrency
+from ordered_map import map_in_order
+from crawl_scheduler import CrawlScheduler
+from checkpoint_journal import CheckpointJournal, get_file_size, truncate_file
+from record_files import RECORD_FILE_FORMATS, get_record_file_format, open_stream_writer
+from metrics import metrics
 
 def silent_remove(filename):
     try:
@@ -15,34 +19,60 @@ def silent_remove(filename):
             raise
 
 class CommentsParser:
-    def __init__(self, api_url="https://epetition.kz/api/public/v1/petitions"):
+    def __init__(self, api_url="https://epetition.kz/api/public/v1/petitions", client=None, fsync=False,
+                 concurrency=None, probe=True, final_states=(), workers=1):
         """
         Инициализация парсера комментариев
 
         Arguments:
         api_url -- API url для получения комментариев
+        client -- HTTP клиент (HttpClient), по умолчанию создается новый
+        fsync -- сбрасывать файл записей на диск в контрольных точках
+        concurrency -- dict максимального количества одновременных запросов по эндпоинтам;
+                       для запросов комментариев, если не задано, используется workers
+        probe -- перед страницами комментариев петиции запрашивать только самый
+                 новый комментарий и пропускать петицию без новых комментариев
+        final_states -- состояния петиции, после которых она не меняется (CrawlScheduler)
+        workers -- количество петиций, комментарии которых запрашиваются одновременно
         """
         self.api_url = api_url
-        self.timeout = 1
+        self.workers = workers
+        self.fsync = fsync
+        self.probe = probe
         self.max_page_size = 1
+        self.max_comments_page_size = 1024
         self.headers = {
             'Accept': 'application/json',
             'Content-Type': 'application/json',
             'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_10_1) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/39.0.2171.95 Safari/537.36'
         }
+        self.client = client or HttpClient(headers=self.headers,
+                                           timeouts={"short": 3, "comments": 5},
+                                           pool_size=max(10, workers + 1),
+                                           concurrency={"comments": workers, **(concurrency or {})})
+        self.journal = CheckpointJournal("comments_parser.journal")
+        self.newest_created_dates = {}
+        self.comments_counts = {}
+        self.scheduler = CrawlScheduler("petitions_catalog_of_comments.json",
+                                        closed_grace_period=timedelta(days=30),
+                                        final_states=final_states)
     
-    def get_new_comments_from_list(self, comments):
+    def get_new_comments_from_list(self, comments, since=None):
         """
         Получение новых комментариев из списка
 
         Arguments:
         comments -- list комментариев
+        since -- время, начиная с которого комментарии считаются новыми,
+                 по умолчанию время прошлого парсинга
         """
+        if since is None:
+            since = self.last_parsing_datetime
         left, right = 0, len(comments)
         while left < right:
             mid = left + (right - left) // 2
             created_date = datetime.fromisoformat(comments[mid]["createdDate"][:19])
-            if created_date > self.last_parsing_datetime:
+            if created_date > since:
                 left = mid + 1
             else:
                 right = mid
@@ -61,32 +91,75 @@ class CommentsParser:
                 "last": False if first_old_comment == len(comments) else True}
 
 
-    def fetch_new_comments(self, petition_id):
+    def fetch_comments_page(self, petition_id, size, page):
         """
-        Получение новых комментариев одной петиции из API
+        Получение страницы комментариев петиции из API, новые комментарии первыми
 
         Arguments:
         petition_id -- id петиции
+        size -- размер страницы
+        page -- номер страницы
         """
+        response = self.client.get(f"{self.api_url}/{petition_id}/comments",
+                                   endpoint="comments",
+                                   params={"size":size, "page":page})
+        return response.json()
+
+
+    def get_first_page_size(self, total, crawled_count):
+        """
+        Получение размера первой страницы комментариев: степень двойки больше
+        ожидаемого количества новых комментариев (разница totalElements и количества
+        при прошлом обходе), не больше max_comments_page_size
+
+        Arguments:
+        total -- количество комментариев петиции (totalElements), None если неизвестно
+        crawled_count -- количество комментариев петиции при прошлом обходе
+        """
+        if total is None:
+            return 2
+        return min(1 << max(1, (total - crawled_count).bit_length()), self.max_comments_page_size)
+
+
+    def fetch_new_comments(self, petition_id, since=None):
+        """
+        Получение новых комментариев одной петиции из API. С probe для уже
+        обходившейся петиции сначала запрашивается только самый новый комментарий
+        (size=1), и если он не новее since, петиция пропускается. Иначе размер первой страницы выбирается
+        по ожидаемому количеству новых комментариев (get_first_page_size), а размер
+        следующих страниц удваивается до max_comments_page_size. Размеры страниц -
+        степени двойки, поэтому позиция каждой страницы делится на ее размер
+
+        Arguments:
+        petition_id -- id петиции
+        since -- время, начиная с которого комментарии считаются новыми
+        """
+        size = self.max_comments_page_size
+        crawled_count = self.scheduler.get_crawled_comments_count(petition_id)
+        if self.probe and crawled_count is not None:
+            comments_page = self.fetch_comments_page(petition_id, 1, 0)
+            total = comments_page.get("totalElements")
+            if total is not None:
+                self.comments_counts[petition_id] = total
+            comments = self.get_new_comments_from_list(comments_page["content"], since)
+            if comments["last"] or comments_page["last"]:
+                metrics.inc("comments_probe_skipped_total")
+                return comments["content"]
+            size = self.get_first_page_size(total, crawled_count)
+
         all_comments = []
-        for i in itertools.count():
-            while True:
-                try:
-                    response = requests.get(f"{self.api_url}/{petition_id}/comments",
-                                            params={"size":1000, "page":i},
-                                            headers=self.headers,
-                                            timeout=self.timeout)
-                    response.raise_for_status()
-                    break
-                except (requests.exceptions.Timeout,
-                        requests.exceptions.ConnectionError):
-                    continue
-            
-            comments = self.get_new_comments_from_list(response.json()["content"])
+        offset = 0
+        while True:
+            comments_page = self.fetch_comments_page(petition_id, size, offset // size)
+            if comments_page.get("totalElements") is not None:
+                self.comments_counts[petition_id] = comments_page["totalElements"]
+            comments = self.get_new_comments_from_list(comments_page["content"], since)
             all_comments.extend(comments["content"])
-            
-            if comments["last"] or response.json()["last"]:
+
+            if comments["last"] or comments_page["last"]:
                 break
+            offset += size
+            size = min(offset, self.max_comments_page_size)
         return all_comments
 
 
@@ -98,84 +171,171 @@ class CommentsParser:
         size -- размер одной страницы списка
         page -- номер страницы списка
         """
-        while True:
-            try:
-                response = requests.get(f"{self.api_url}/short",
-                                        params={"size":size, "page":page},
-                                        headers=self.headers,
-                                        timeout=self.timeout)
-                response.raise_for_status()
-                break
-            except (requests.exceptions.Timeout,
-                    requests.exceptions.ConnectionError):
-                continue
+        response = self.client.get(f"{self.api_url}/short", endpoint="short",
+                                   params={"size":size, "page":page})
         return response.json()
 
 
-    def save_to_csv(self, comments, csv_path):
+    def fetch_petition_list(self):
+        """
+        Получение всего списка кратких петиций из API
+        """
+        short_petitions = []
+        for i in itertools.count():
+            petition_list_page = self.fetch_petition_list_page(self.max_page_size, i)
+            short_petitions.extend(petition_list_page["content"])
+            if petition_list_page["last"]:
+                break
+        return short_petitions
+
+
+    def crawl_petitions(self, planned_petitions, csv_path, journal, file_format="csv", sink=None):
         """
-        Сохранение комментариев в CSV файл
+        Парсинг новых комментариев запланированных петиций и сохранение в файле записей.
+        Комментарии workers петиций запрашиваются одновременно, а записываются
+        в порядке плана. Количество обработанных петиций и размер файла сохраняются в журнал,
+        повторный вызов с тем же журналом продолжает парсинг с места остановки
 
         Arguments:
-        comments -- list комментариев в формате json
-        csv_path -- Путь к CSV файлу
+        planned_petitions -- list пар (краткая петиция, время, начиная с которого
+                             комментарии считаются новыми)
+        csv_path -- Путь к файлу записей
+        journal -- журнал контрольных точек (CheckpointJournal)
+        file_format -- формат файла записей: csv, ndjson или ndjson.gz
+        sink -- приемник записей (pipeline.QueueSink) вместо файла записей
         """
-        if len(comments) == 0:
-            return
-        field_names = comments[0].keys()
-        
-        with open(csv_path, 'a', newline='', encoding='utf-8') as csv_file:
-            writer = csv.DictWriter(csv_file, fieldnames=field_names)
+        progress = journal.load()
+        if progress is None or (sink is None and not truncate_file(csv_path, progress["size"])):
+            silent_remove(csv_path)
+            progress = {"done": 0, "size": 0, "newest": {}, "counts": {}}
+        done = progress["done"]
+        self.newest_created_dates.update(progress["newest"])
+        self.comments_counts.update(progress.get("counts", {}))
+        writer = sink if sink is not None else open_stream_writer(csv_path, file_format, fsync=self.fsync)
+        try:
+            planned_comments = map_in_order(
+                lambda planned: self.fetch_new_comments(planned[0]["id"], planned[1]),
+                planned_petitions[done:], self.workers)
+            for (short_petition, _), comments in zip(planned_petitions[done:], planned_comments):
+                writer.write_rows(comments)
+                if comments:
+                    self.newest_created_dates[short_petition["id"]] = max(f["createdDate"][:19]
+                                                                          for f in comments)
+                done += 1
+                if journal.is_due():
+                    journal.save({"done": done, "size": writer.checkpoint(),
+                                  "newest": self.newest_created_dates, "counts": self.comments_counts})
+        finally:
+            journal.save({"done": done, "size": writer.checkpoint(),
+                          "newest": self.newest_created_dates, "counts": self.comments_counts})
+            writer.close()
 
-            if os.path.getsize(csv_path) == 0:
-                writer.writeheader()
-            writer.writerows(comments)
+
+    def get_resumable_csv_path(self):
+        """
+        Получение пути к файлу прерванного парсинга, None если его нет
+        """
+        state = self.journal.load()
+        return state["csvPath"] if state else None
 
 
-    def run(self, csv_path):
+    def run(self, csv_path, sink=None):
         """
-        Парсинг новых комментариев, либо всех при первом запуске, и сохранение в CSV файле
+        Парсинг новых комментариев, либо всех при первом запуске, и сохранение в файле записей.
+        Комментарии пишутся во временный файл csv_path.part, план и прогресс парсинга
+        сохраняются в журнал, после сбоя повторный запуск с тем же csv_path продолжает
+        парсинг с места остановки. С приемником sink записи передаются загрузчику
+        базы данных вместо файла, а время последнего парсинга обновляется после их загрузки
         
         Arguments:
-        csv_path -- Путь к CSV файлу
+        csv_path -- Путь к файлу записей, с sink - имя запуска для журнала
+        sink -- приемник записей (pipeline.QueueSink) вместо файла записей
         """
-        try:
-            with open("last_parsing_of_comments.txt", "r") as f:
-                self.last_parsing_datetime = datetime.fromisoformat(f.read())
-        except:
-            self.last_parsing_datetime = datetime.fromisoformat("1900-01-01T00:00:00")   
-        self.new_last_parsing_datetime = datetime.now().replace(microsecond=0) - timedelta(seconds=1)
+        file_format = get_record_file_format(csv_path)
+        part_path = csv_path + ".part"
+        progress_journal = CheckpointJournal(part_path + ".journal")
+        state = self.journal.load()
+        if state is not None and state["csvPath"] == csv_path:
+            self.last_parsing_datetime = datetime.fromisoformat(state["lastParsingDatetime"])
+            self.new_last_parsing_datetime = datetime.fromisoformat(state["newLastParsingDatetime"])
+            planned_petitions = [(f["petition"], datetime.fromisoformat(f["since"]))
+                                 for f in state["plan"]]
+        else:
+            try:
+                with open("last_parsing_of_comments.txt", "r") as f:
+                    self.last_parsing_datetime = datetime.fromisoformat(f.read())
+            except:
+                self.last_parsing_datetime = datetime.fromisoformat("1900-01-01T00:00:00")   
+
+            silent_remove(part_path)
+            progress_journal.clear()
+            with metrics.stage("comments_plan"):
+                short_petitions = self.fetch_petition_list()
+            self.new_last_parsing_datetime = datetime.now().replace(microsecond=0) - timedelta(seconds=1)
+            planned_petitions = self.scheduler.plan(short_petitions,
+                                                    self.last_parsing_datetime,
+                                                    self.new_last_parsing_datetime)
+            self.journal.save({"csvPath": csv_path,
+                              "lastParsingDatetime": self.last_parsing_datetime.isoformat(),
+                              "newLastParsingDatetime": self.new_last_parsing_datetime.isoformat(),
+                              "plan": [{"petition": short_petition, "since": since.isoformat()}
+                                       for short_petition, since in planned_petitions]})
         
         silent_remove(csv_path)
-        try:
-            for i in itertools.count():
-                petition_list_page = self.fetch_petition_list_page(self.max_page_size, i)
-
-                for short_petition in petition_list_page["content"]:
-                    comments = self.fetch_new_comments(short_petition["id"])
-                    self.save_to_csv(comments, csv_path)
-
-                if petition_list_page["last"]:
-                    break
-                
-            with open("last_parsing_of_comments.txt", "w") as f:
-                f.write(self.new_last_parsing_datetime.isoformat())
-        except:
-            silent_remove(csv_path)
-            raise
+        with metrics.stage("comments_crawl"):
+            self.crawl_petitions(planned_petitions, part_path, progress_journal, file_format, sink)
+        if get_file_size(part_path) > 0:
+            os.replace(part_path, csv_path)
+        else:
+            silent_remove(part_path)
 
+        for short_petition, _ in planned_petitions:
+            self.scheduler.mark_crawled(short_petition["id"], self.new_last_parsing_datetime,
+                                        newest_created_date=self.newest_created_dates.get(short_petition["id"]),
+                                        comments_count=self.comments_counts.get(short_petition["id"]))
+        self.scheduler.save()
+        with open("last_parsing_of_comments.txt", "w") as f:
+            f.write(self.new_last_parsing_datetime.isoformat())
+        progress_journal.clear()
+        self.journal.clear()
 
 if __name__ == "__main__":
     import argparse
     arg_parser = argparse.ArgumentParser(prog="comments parser")
     arg_parser.add_argument("-f", "--filename")
+    arg_parser.add_argument("--format", choices=RECORD_FILE_FORMATS, default="csv",
+                            help="формат файла записей")
+    arg_parser.add_argument("--concurrency", type=parse_concurrency, action="append", default=[],
+                            metavar="comments=N",
+                            help="максимальное количество одновременных запросов комментариев, "
+                                 "количество подбирается по ответам сервера, по умолчанию -w")
+    arg_parser.add_argument("-w", "--workers", type=int, default=4,
+                            help="количество петиций, комментарии которых запрашиваются одновременно")
+    arg_parser.add_argument("--no-probe", action="store_true",
+                            help="не запрашивать самый новый комментарий перед страницами комментариев")
+    arg_parser.add_argument("--final-state", action="append", default=[],
+                            help="состояние петиции, после которого она не меняется и обходится редко, "
+                                 "можно указать несколько раз; без него петиции закрываются по deadline")
+    arg_parser.add_argument("--fsync", action="store_true",
+                            help="сбрасывать файл записей на диск в контрольных точках")
+    arg_parser.add_argument("--metrics-file",
+                            help="файл метрик, сохраняемый в конце запуска: .json - JSON сводка, иначе формат Prometheus")
+    arg_parser.add_argument("--metrics-stages", action="store_true",
+                            help="добавлять в файл метрик время этапов запуска")
     args = arg_parser.parse_args()
+    if set(dict(args.concurrency)) - {"comments"}:
+        arg_parser.error("--concurrency: only comments requests are sent concurrently")
+    if args.metrics_file:
+        metrics.save_at_exit(args.metrics_file, stages=args.metrics_stages)
     
-    parser = CommentsParser()
+    parser = CommentsParser(fsync=args.fsync, concurrency=dict(args.concurrency), probe=not args.no_probe,
+                            final_states=args.final_state, workers=args.workers)
     
     if args.filename:
-        parser.run(f"{args.filename}.csv")
+        parser.run(f"{args.filename}.{args.format}")
+    elif parser.get_resumable_csv_path():
+        parser.run(parser.get_resumable_csv_path())
     else:
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        parser.run(f"comments_{timestamp}.csv")
+        parser.run(f"comments_{timestamp}.{args.format}")
 
@@ -0,0 +1,97 @@
+import threading
+
+
+class ConcurrencyLimiter:
+    def __init__(self, max_limit, min_limit=1, decrease_ratio=0.5, latency_tolerance=2.0):
+        """
+        Инициализация ограничителя одновременных запросов к эндпоинту по схеме
+        AIMD: пока задержка ответов не растет, предел увеличивается (сначала
+        на 1 за ответ, после первой перегрузки - на 1 за предел ответов), а при
+        таймаутах, 429 и 5xx умножается на decrease_ratio
+
+        Arguments:
+        max_limit -- максимальное количество одновременных запросов
+        min_limit -- минимальное количество одновременных запросов
+        decrease_ratio -- множитель предела при перегрузке сервера
+        latency_tolerance -- во сколько раз задержка может превышать базовую,
+                             чтобы предел еще увеличивался
+        """
+        self.max_limit = max_limit
+        self.min_limit = min_limit
+        self.decrease_ratio = decrease_ratio
+        self.latency_tolerance = latency_tolerance
+        self.limit = float(min_limit)
+        self.in_flight = 0
+        self.slow_start = True
+        self.baseline_latency = None
+        # номер периода между уменьшениями предела: ответы на запросы,
+        # отправленные до последнего уменьшения, предел больше не уменьшают
+        self.epoch = 0
+        self.condition = threading.Condition()
+
+
+    def acquire(self):
+        """
+        Ожидание свободного места под запрос. Возвращает номер периода
+        для release
+        """
+        with self.condition:
+            while self.in_flight >= int(self.limit):
+                self.condition.wait()
+            self.in_flight += 1
+            return self.epoch
+
+
+    def release(self, epoch, latency=None, overloaded=False):
+        """
+        Освобождение места запроса и изменение предела по результату запроса.
+        Возвращает True, если предел был уменьшен
+
+        Arguments:
+        epoch -- номер периода, полученный acquire
+        latency -- задержка ответа в секундах, None - ответ не получен
+        overloaded -- сервер перегружен: таймаут, ошибка соединения, 429 или 5xx
+        """
+        with self.condition:
+            saturated = self.in_flight >= int(self.limit)
+            self.in_flight -= 1
+            decreased = False
+            if overloaded:
+                if epoch == self.epoch:
+                    self.limit = max(self.min_limit, self.limit * self.decrease_ratio)
+                    self.slow_start = False
+                    self.epoch += 1
+                    decreased = True
+            elif latency is not None:
+                self.update_limit(latency, saturated)
+            self.condition.notify_all()
+            return decreased
+
+
+    def update_limit(self, latency, saturated):
+        """
+        Увеличение предела после успешного ответа, если задержка не выросла
+        относительно базовой и предел был исчерпан
+
+        Arguments:
+        latency -- задержка ответа в секундах
+        saturated -- все места были заняты в момент ответа
+        """
+        if self.baseline_latency is None or latency < self.baseline_latency:
+            self.baseline_latency = latency
+        else:
+            # базовая задержка медленно догоняет текущую, чтобы случайный
+            # быстрый ответ не останавливал рост предела навсегда
+            self.baseline_latency += (latency - self.baseline_latency) * 0.01
+        if not saturated or latency > self.baseline_latency * self.latency_tolerance:
+            return
+        increase = 1 if self.slow_start else 1 / self.limit
+        self.limit = min(self.max_limit, self.limit + increase)
+
+
+    def get_limit(self):
+        """
+        Получение текущего предела одновременных запросов
+        """
+        with self.condition:
+            return int(self.limit)
@@ -0,0 +1,192 @@
+import json
+import os
+from datetime import datetime
+from datetime import timedelta
+
+
+class CrawlScheduler:
+    def __init__(self, catalog_path, closed_grace_period=timedelta(days=1),
+                 closed_recrawl_interval=timedelta(days=30), final_states=()):
+        """
+        Инициализация планировщика обхода петиций с локальным каталогом
+        состояний и сроков петиций
+
+        Arguments:
+        catalog_path -- путь к JSON файлу каталога
+        closed_grace_period -- время после deadline, в течение которого петиция
+                               еще считается активной
+        closed_recrawl_interval -- как часто обходить закрытые петиции,
+                                   None - закрытые петиции обходятся только один раз
+        final_states -- состояния петиции, после которых она не меняется. Состояние,
+                        из которого петиция хоть раз перешла в другое, конечным
+                        не считается; без конечных состояний петиция закрывается
+                        только по deadline
+        """
+        self.catalog_path = catalog_path
+        self.closed_grace_period = closed_grace_period
+        self.closed_recrawl_interval = closed_recrawl_interval
+        self.final_states = set(final_states)
+        try:
+            with open(catalog_path, "r", encoding="utf-8") as f:
+                self.catalog = json.load(f)
+        except (OSError, ValueError):
+            self.catalog = {}
+        self.left_states = {state for entry in self.catalog.values()
+                            for state in entry.get("previousStates", [])}
+
+
+    def update(self, short_petition, now):
+        """
+        Обновление записи каталога по краткой петиции из списка,
+        изменение signersCount считается активностью петиции. Состояния,
+        из которых петиция перешла в другое, запоминаются в previousStates
+
+        Arguments:
+        short_petition -- краткая петиция из списка петиций
+        now -- время обновления
+        """
+        entry = self.catalog.setdefault(short_petition["id"], {"lastActivity": now.isoformat()})
+        state = short_petition.get("state")
+        if state is not None and entry.get("state") not in (None, state):
+            if entry["state"] not in entry.setdefault("previousStates", []):
+                entry["previousStates"].append(entry["state"])
+            self.left_states.add(entry["state"])
+        for key in ("state", "deadline"):
+            if short_petition.get(key) is not None:
+                entry[key] = short_petition[key]
+        signers_count = short_petition.get("signersCount")
+        if signers_count is not None:
+            if entry.get("signersCount") != signers_count:
+                entry["lastActivity"] = now.isoformat()
+            entry["signersCount"] = signers_count
+        return entry
+
+
+    def is_closed(self, entry, now):
+        """
+        Проверка, что петиция больше не может измениться: петиция в конечном
+        состоянии, либо прошел ее deadline
+
+        Arguments:
+        entry -- запись каталога
+        now -- текущее время
+        """
+        if entry.get("state") in self.final_states and entry["state"] not in self.left_states:
+            return True
+        if entry.get("deadline"):
+            deadline = datetime.fromisoformat(entry["deadline"][:19])
+            return deadline + self.closed_grace_period < now
+        return False
+
+
+    def is_due(self, entry, now):
+        """
+        Проверка, что петицию нужно обойти в текущем запуске: петиция
+        еще не обходилась, не закрыта, изменилась после последнего обхода,
+        либо прошел интервал повторного обхода закрытых петиций
+
+        Arguments:
+        entry -- запись каталога
+        now -- текущее время
+        """
+        if "lastCrawled" not in entry or not self.is_closed(entry, now):
+            return True
+        last_crawled = datetime.fromisoformat(entry["lastCrawled"])
+        if datetime.fromisoformat(entry["lastActivity"]) > last_crawled:
+            return True
+        if self.closed_recrawl_interval is None:
+            return False
+        return now - last_crawled >= self.closed_recrawl_interval
+
+
+    def get_since(self, entry, default_since):
+        """
+        Получение времени, начиная с которого записи петиции считаются новыми:
+        время самой новой полученной записи петиции, либо время последнего обхода
+
+        Arguments:
+        entry -- запись каталога
+        default_since -- время для петиций, которые еще не обходились планировщиком
+        """
+        if "newestCreatedDate" in entry:
+            return datetime.fromisoformat(entry["newestCreatedDate"][:19])
+        if "lastCrawled" in entry:
+            return datetime.fromisoformat(entry["lastCrawled"])
+        return default_since
+
+
+    def get_crawled_signers_count(self, petition_id):
+        """
+        Получение signersCount петиции на момент последнего обхода, None если
+        петиция еще не обходилась
+
+        Arguments:
+        petition_id -- id петиции
+        """
+        return self.catalog.get(petition_id, {}).get("crawledSignersCount")
+
+
+    def get_crawled_comments_count(self, petition_id):
+        """
+        Получение количества комментариев петиции на момент последнего обхода,
+        None если оно неизвестно
+
+        Arguments:
+        petition_id -- id петиции
+        """
+        return self.catalog.get(petition_id, {}).get("crawledCommentsCount")
+
+
+    def plan(self, short_petitions, default_since, now):
+        """
+        Получение списка петиций для обхода в порядке убывания активности.
+        Возвращает list пар (краткая петиция, время, начиная с которого нужны
+        новые записи этой петиции)
+
+        Arguments:
+        short_petitions -- list кратких петиций из списка петиций
+        default_since -- время, начиная с которого нужны записи петиций,
+                         которые еще не обходились планировщиком
+        now -- время текущего запуска
+        """
+        planned = []
+        for short_petition in short_petitions:
+            entry = self.update(short_petition, now)
+            if not self.is_due(entry, now):
+                continue
+            planned.append((entry["lastActivity"], short_petition, self.get_since(entry, default_since)))
+        planned.sort(key=lambda f: f[0], reverse=True)
+        return [(short_petition, since) for _, short_petition, since in planned]
+
+
+    def mark_crawled(self, petition_id, crawled_until, signers_count=None, newest_created_date=None,
+                     comments_count=None):
+        """
+        Отметка петиции как обойденной и обновление ее водяных знаков
+
+        Arguments:
+        petition_id -- id петиции
+        crawled_until -- время, до которого получены записи петиции
+        signers_count -- signersCount петиции из списка петиций на момент обхода
+        newest_created_date -- createdDate самой новой полученной записи петиции
+        comments_count -- количество комментариев петиции (totalElements) на момент обхода
+        """
+        entry = self.catalog.setdefault(petition_id, {"lastActivity": crawled_until.isoformat()})
+        entry["lastCrawled"] = crawled_until.isoformat()
+        if signers_count is not None:
+            entry["crawledSignersCount"] = signers_count
+        if comments_count is not None:
+            entry["crawledCommentsCount"] = comments_count
+        if newest_created_date is not None:
+            entry["newestCreatedDate"] = max(newest_created_date[:19],
+                                             entry.get("newestCreatedDate", ""))
+
+
+    def save(self):
+        """
+        Сохранение каталога в JSON файл
+        """
+        tmp_path = self.catalog_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.catalog, f, ensure_ascii=False)
+        os.replace(tmp_path, self.catalog_path)
@@ -0,0 +1,101 @@
+import csv
+import os
+from metrics import metrics
+
+
+class CsvStreamWriter:
+    def __init__(self, csv_path, field_names=None, buffer_size=1000, fsync=False):
+        """
+        Инициализация буферизованной записи в CSV файл. Файл открывается один раз
+        на дозапись, набор столбцов фиксируется заголовком файла, либо полями
+        первой записи, и не меняется до конца записи
+
+        Arguments:
+        csv_path -- путь к CSV файлу
+        field_names -- столбцы CSV файла, по умолчанию поля первой записи
+        buffer_size -- количество записей, после которого буфер сбрасывается в файл
+        fsync -- сбрасывать файл на диск (os.fsync) в контрольных точках
+        """
+        self.csv_path = csv_path
+        self.buffer_size = buffer_size
+        self.fsync = fsync
+        self.rows = []
+        self.csv_file = open(csv_path, 'a', newline='', encoding='utf-8')
+        self.has_header = self.csv_file.tell() > 0
+        if self.has_header and field_names is None:
+            with open(csv_path, newline='', encoding='utf-8') as f:
+                field_names = next(csv.reader(f))
+        self.writer = None
+        if field_names is not None:
+            self.create_writer(field_names)
+
+
+    def create_writer(self, field_names):
+        """
+        Создание DictWriter с фиксированным набором столбцов,
+        поля записей вне набора отбрасываются, отсутствующие остаются пустыми
+
+        Arguments:
+        field_names -- столбцы CSV файла
+        """
+        self.writer = csv.DictWriter(self.csv_file, fieldnames=list(field_names),
+                                     extrasaction="ignore")
+        if not self.has_header:
+            self.writer.writeheader()
+            self.has_header = True
+
+
+    def write_row(self, row):
+        """
+        Добавление записи в буфер
+
+        Arguments:
+        row -- запись (dict)
+        """
+        if self.writer is None:
+            self.create_writer(row.keys())
+        self.rows.append(row)
+        if len(self.rows) >= self.buffer_size:
+            self.flush()
+
+
+    def write_rows(self, rows):
+        """
+        Добавление записей в буфер
+
+        Arguments:
+        rows -- list записей (dict)
+        """
+        for row in rows:
+            self.write_row(row)
+
+
+    def flush(self):
+        """
+        Запись буфера в файл
+        """
+        if self.rows:
+            metrics.inc("rows_written_total", len(self.rows), format="csv")
+            self.writer.writerows(self.rows)
+            self.rows.clear()
+        self.csv_file.flush()
+
+
+    def checkpoint(self):
+        """
+        Запись буфера в файл и, если задано fsync, на диск.
+        Возвращает размер файла в байтах
+        """
+        self.flush()
+        if self.fsync:
+            os.fsync(self.csv_file.fileno())
+        return self.csv_file.tell()
+
+
+    def close(self):
+        """
+        Запись буфера и закрытие файла
+        """
+        if not self.csv_file.closed:
+            self.flush()
+            self.csv_file.close()
@@ -0,0 +1,76 @@
+import datetime
+from metrics import metrics
+
+COPY_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"})
+
+
+def format_copy_value(value):
+    """
+    Преобразование значения в текстовый формат COPY
+
+    Arguments:
+    value -- значение столбца
+    """
+    if value is None:
+        return "\\N"
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    return str(value).translate(COPY_ESCAPES)
+
+
+class CopyRowsReader:
+    def __init__(self, rows):
+        """
+        Файлоподобный объект для COPY FROM STDIN, формирующий текст COPY
+        из итератора строк по мере чтения, не держа все строки в памяти
+
+        Arguments:
+        rows -- итератор строк, каждая строка - tuple значений столбцов
+        """
+        self.rows = iter(rows)
+        self.buffer = ""
+        self.count = 0
+
+
+    def read(self, size=-1):
+        """
+        Чтение текста COPY размером около size символов, все оставшиеся строки при size < 0
+
+        Arguments:
+        size -- количество символов
+        """
+        lines = [self.buffer]
+        length = len(self.buffer)
+        for row in self.rows:
+            line = "\t".join(format_copy_value(f) for f in row) + "\n"
+            lines.append(line)
+            length += len(line)
+            self.count += 1
+            if 0 <= size <= length:
+                break
+        data = "".join(lines)
+        if size < 0:
+            self.buffer = ""
+            return data
+        self.buffer = data[size:]
+        return data[:size]
+
+
+def copy_rows(curs, table_name, column_names, rows):
+    """
+    Добавление строк в таблицу одной командой COPY FROM STDIN. Строки
+    читаются из итератора по мере отправки. Возвращает количество добавленных строк
+
+    Arguments:
+    curs -- курсор базы данных
+    table_name -- имя таблицы
+    column_names -- list имен столбцов
+    rows -- итератор строк, каждая строка - tuple значений столбцов в порядке column_names
+    """
+    reader = CopyRowsReader(rows)
+    with metrics.timer("db_copy_seconds", table=table_name):
+        curs.copy_expert(f"COPY {table_name} ({', '.join(column_names)}) FROM STDIN", reader)
+    metrics.inc("db_rows_copied_total", reader.count, table=table_name)
+    return reader.count
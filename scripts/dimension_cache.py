@@ -0,0 +1,74 @@
+from psycopg2.extras import execute_values
+from metrics import metrics
+
+
+class DimensionCache:
+    def __init__(self, conn, table_name, key_column, column_names):
+        """
+        Инициализация кеша таблицы-справочника, отображающего естественный
+        ключ записи (name, uuid) в id. Кеш заполняется из таблицы при создании,
+        новые записи добавляются пачками через add и flush
+
+        Arguments:
+        conn -- соединение с базой данных (psycopg2.connect)
+        table_name -- имя таблицы
+        key_column -- столбец естественного ключа
+        column_names -- list столбцов, заполняемых при добавлении записи
+        """
+        self.conn = conn
+        self.table_name = table_name
+        self.key_column = key_column
+        self.column_names = column_names
+        self.ids = {}
+        self.pending = {}
+        self.warm()
+
+
+    def warm(self):
+        """
+        Заполнение кеша ключами и id всех записей таблицы
+        """
+        with self.conn.cursor() as curs:
+            curs.execute(f"SELECT {self.key_column}, id FROM {self.table_name};")
+            self.ids = dict(curs.fetchall())
+        self.pending = {}
+
+
+    def add(self, key, values):
+        """
+        Добавление записи в очередь на вставку, если ее ключа нет в кеше
+
+        Arguments:
+        key -- естественный ключ записи, None игнорируется
+        values -- tuple значений столбцов column_names
+        """
+        if key is not None and key not in self.ids:
+            self.pending.setdefault(key, values)
+
+
+    def flush(self):
+        """
+        Вставка записей из очереди одним запросом INSERT ... RETURNING
+        и добавление их id в кеш
+        """
+        if not self.pending:
+            return
+        with self.conn.cursor() as curs:
+            rows = execute_values(curs, f"""INSERT INTO {self.table_name} ({", ".join(self.column_names)})
+                                            VALUES %s RETURNING {self.key_column}, id;""",
+                                  list(self.pending.values()), page_size=len(self.pending), fetch=True)
+        metrics.inc("db_rows_inserted_total", len(rows), table=self.table_name)
+        self.ids.update(rows)
+        self.pending = {}
+
+
+    def get_id(self, key):
+        """
+        Получение id записи по естественному ключу, None для ключа None
+
+        Arguments:
+        key -- естественный ключ записи
+        """
+        if key is None:
+            return None
+        return self.ids[key]
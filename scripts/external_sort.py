@@ -0,0 +1,63 @@
+import heapq
+import tempfile
+from record_files import json_dumps, json_loads
+
+
+def write_sorted_chunk(records, key, directory=None):
+    """
+    Сортировка части записей и запись во временный NDJSON файл,
+    удаляемый при закрытии. Возвращает открытый файл
+
+    Arguments:
+    records -- list записей (dict с JSON значениями)
+    key -- функция ключа сортировки
+    directory -- директория временных файлов, по умолчанию системная
+    """
+    records.sort(key=key)
+    chunk_file = tempfile.TemporaryFile(dir=directory)
+    for record in records:
+        chunk_file.write(json_dumps(record))
+        chunk_file.write(b"\n")
+    chunk_file.seek(0)
+    return chunk_file
+
+
+def iterate_chunk(chunk_file):
+    """
+    Перебор записей временного файла с закрытием файла в конце
+
+    Arguments:
+    chunk_file -- файл, записанный write_sorted_chunk
+    """
+    with chunk_file:
+        for line in chunk_file:
+            yield json_loads(line)
+
+
+def sort_records(records, key, chunk_size=100000, directory=None):
+    """
+    Внешняя сортировка слиянием: записи читаются частями по chunk_size,
+    каждая часть сортируется и сбрасывается во временный файл, затем части
+    сливаются. В памяти одновременно находится не больше одной части и по
+    одной записи каждой части. Записи читаются и части сбрасываются при вызове,
+    возвращается итератор отсортированных записей
+
+    Arguments:
+    records -- итератор записей (dict с JSON значениями)
+    key -- функция ключа сортировки
+    chunk_size -- количество записей в одной части
+    directory -- директория временных файлов, по умолчанию системная
+    """
+    chunk_files = []
+    chunk = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) >= chunk_size:
+            chunk_files.append(write_sorted_chunk(chunk, key, directory))
+            chunk = []
+    if not chunk_files:
+        chunk.sort(key=key)
+        return iter(chunk)
+    if chunk:
+        chunk_files.append(write_sorted_chunk(chunk, key, directory))
+    return heapq.merge(*(iterate_chunk(f) for f in chunk_files), key=key)
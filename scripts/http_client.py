@@ -0,0 +1,251 @@
+import requests
+from requests.adapters import HTTPAdapter
+import itertools
+import random
+import threading
+import time
+from metrics import metrics
+from concurrency_limiter import ConcurrencyLimiter
+
+RETRY_STATUSES = (429, 502, 503, 504)
+
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+def parse_concurrency(value):
+    """
+    Разбор параметра командной строки ENDPOINT=N в пару (эндпоинт, N)
+
+    Arguments:
+    value -- значение параметра
+    """
+    endpoint, _, max_limit = value.partition("=")
+    if not endpoint or not max_limit.isdigit() or int(max_limit) < 1:
+        raise ValueError(f"{value}: expected ENDPOINT=N")
+    return endpoint, int(max_limit)
+
+
+class HttpClient:
+    def __init__(self, headers=None, timeouts=None, default_timeout=5,
+                 max_retries=8, backoff_base=0.5, backoff_max=30, pool_size=10, concurrency=None,
+                 retry_budget=0.2, min_retry_budget=10):
+        """
+        Инициализация HTTP клиента с пулом keep-alive соединений
+
+        Arguments:
+        headers -- заголовки, отправляемые с каждым запросом
+        timeouts -- dict таймаутов в секундах по названиям эндпоинтов
+        default_timeout -- таймаут для эндпоинтов, не указанных в timeouts
+        max_retries -- максимальное количество повторов одного запроса
+        backoff_base -- начальная пауза перед повтором в секундах
+        backoff_max -- максимальная пауза перед повтором в секундах
+        pool_size -- максимальное количество соединений с одним хостом
+        concurrency -- dict максимального количества одновременных запросов
+                       по названиям эндпоинтов, количество одновременных запросов
+                       этих эндпоинтов подбирается по ответам сервера (ConcurrencyLimiter)
+        retry_budget -- общий бюджет повторов клиента: доля повторов от количества
+                        запросов, после исчерпания бюджета ошибки не повторяются
+        min_retry_budget -- количество повторов, разрешенных сверх доли retry_budget
+        """
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        if headers:
+            self.session.headers.update(headers)
+
+        self.timeouts = dict(timeouts or {})
+        self.default_timeout = default_timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.retry_budget = retry_budget
+        self.min_retry_budget = min_retry_budget
+        self.limiters = {endpoint: ConcurrencyLimiter(max_limit)
+                         for endpoint, max_limit in (concurrency or {}).items()}
+
+        self.lock = threading.Lock()
+        self.sent_count = 0
+        self.retried_count = 0
+
+
+    def get_timeout(self, endpoint):
+        """
+        Получение таймаута эндпоинта
+
+        Arguments:
+        endpoint -- название эндпоинта
+        """
+        return self.timeouts.get(endpoint, self.default_timeout)
+
+
+    def get_backoff(self, attempt, response=None):
+        """
+        Получение паузы перед повтором: экспоненциальный рост с полным jitter,
+        либо значение заголовка Retry-After, если сервер его прислал
+
+        Arguments:
+        attempt -- номер неудачной попытки, начиная с 0
+        response -- ответ сервера, если он был получен
+        """
+        if response is not None:
+            retry_after = response.headers.get("Retry-After", "")
+            if retry_after.isdigit():
+                return min(self.backoff_max, int(retry_after))
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+
+    def take_retry(self, endpoint):
+        """
+        Получение повтора из общего бюджета повторов клиента. Возвращает False,
+        если бюджет исчерпан: во время сбоя сервера повторы не умножают нагрузку,
+        а ошибки сразу пробрасываются
+
+        Arguments:
+        endpoint -- название эндпоинта для статистики
+        """
+        with self.lock:
+            if self.retried_count >= self.min_retry_budget + self.retry_budget * self.sent_count:
+                exhausted = True
+            else:
+                self.retried_count += 1
+                exhausted = False
+        if exhausted:
+            metrics.inc("http_retry_budget_exhausted_total", endpoint=endpoint)
+            return False
+        metrics.inc("http_retries_total", endpoint=endpoint)
+        return True
+
+
+    def filter_body(self, response, body_filter):
+        """
+        Чтение тела успешного ответа по частям через фильтр: полное тело
+        не хранится в памяти, а response.content и response.json() возвращают
+        отфильтрованное тело. Размер полученного тела сохраняется в response.received_size
+
+        Arguments:
+        response -- ответ, полученный с stream=True
+        body_filter -- функция создания фильтра тела (JsonFieldFilter)
+        """
+        byte_filter = body_filter()
+        try:
+            response._content = byte_filter.filter(response.iter_content(STREAM_CHUNK_SIZE))
+        finally:
+            response.close()
+        response.received_size = byte_filter.input_size
+
+
+    def send(self, url, endpoint, params=None, headers=None, allowed_statuses=(), body_filter=None):
+        """
+        Один GET запрос без повторов. Если для эндпоинта задан ограничитель,
+        запрос ждет свободного места, а результат запроса меняет предел
+        ограничителя: таймауты, ошибки соединения, 429 и 5xx, кроме
+        allowed_statuses, считаются перегрузкой сервера
+
+        Arguments:
+        url -- адрес запроса
+        endpoint -- название эндпоинта
+        params -- параметры запроса
+        headers -- дополнительные заголовки запроса
+        allowed_statuses -- статусы ошибок, ожидаемые вызывающим кодом
+        body_filter -- функция создания фильтра тела успешного ответа (filter_body)
+        """
+        limiter = self.limiters.get(endpoint)
+        epoch = None
+        if limiter is not None:
+            with metrics.timer("http_concurrency_wait_seconds", endpoint=endpoint):
+                epoch = limiter.acquire()
+        latency, overloaded = None, True
+        start = time.perf_counter()
+        try:
+            response = self.session.get(url, params=params, headers=headers,
+                                        timeout=self.get_timeout(endpoint), stream=body_filter is not None)
+            if body_filter is not None and response.status_code == 200:
+                self.filter_body(response, body_filter)
+            latency = time.perf_counter() - start
+            overloaded = (response.status_code == 429
+                          or (response.status_code >= 500 and response.status_code not in allowed_statuses))
+        finally:
+            if limiter is not None and limiter.release(epoch, latency, overloaded):
+                metrics.inc("http_concurrency_decreases_total", endpoint=endpoint)
+        metrics.observe("http_request_seconds", latency, endpoint=endpoint)
+        return response
+
+
+    def get(self, url, endpoint="default", params=None, headers=None, allowed_statuses=(), body_filter=None):
+        """
+        GET запрос с повторами при таймаутах, ошибках соединения и статусах
+        из RETRY_STATUSES. После max_retries повторов или при исчерпании общего
+        бюджета повторов (take_retry) пробрасывается последняя ошибка
+
+        Arguments:
+        url -- адрес запроса
+        endpoint -- название эндпоинта для таймаута и статистики
+        params -- параметры запроса
+        headers -- дополнительные заголовки запроса
+        allowed_statuses -- статусы ошибок, при которых ответ возвращается без исключения
+        body_filter -- функция создания фильтра тела успешного ответа (filter_body)
+        """
+        with self.lock:
+            self.sent_count += 1
+        for attempt in itertools.count():
+            metrics.inc("http_requests_total", endpoint=endpoint)
+            try:
+                response = self.send(url, endpoint, params, headers, allowed_statuses, body_filter)
+            except (requests.exceptions.Timeout,
+                    requests.exceptions.ConnectionError) as e:
+                if isinstance(e, requests.exceptions.Timeout):
+                    metrics.inc("http_timeouts_total", endpoint=endpoint)
+                else:
+                    metrics.inc("http_connection_errors_total", endpoint=endpoint)
+                if attempt >= self.max_retries or not self.take_retry(endpoint):
+                    raise
+                time.sleep(self.get_backoff(attempt))
+                continue
+            metrics.inc("http_responses_total", endpoint=endpoint, status=response.status_code)
+            metrics.inc("http_response_bytes_total", getattr(response, "received_size", len(response.content)),
+                        endpoint=endpoint)
+
+            if response.status_code in allowed_statuses:
+                return response
+            if (response.status_code in RETRY_STATUSES and attempt < self.max_retries
+                    and self.take_retry(endpoint)):
+                time.sleep(self.get_backoff(attempt, response))
+                continue
+            response.raise_for_status()
+            return response
+
+
+    def get_cached(self, url, cache, endpoint="default", params=None, offline=False, body_filter=None):
+        """
+        GET запрос с дисковым кешем ответов (ResponseCache). Если ответ есть в кеше,
+        выполняется условный запрос с If-None-Match / If-Modified-Since, и при ответе
+        304 тело берется из кеша. Если сервер не поддерживает условные запросы,
+        неизменность ответа определяется по хешу содержимого. С body_filter в кеш
+        сохраняется отфильтрованное тело. Возвращает тело ответа (str)
+
+        Arguments:
+        url -- адрес запроса
+        cache -- кеш ответов
+        endpoint -- название эндпоинта для таймаута и статистики
+        params -- параметры запроса
+        offline -- не выполнять запросы, брать ответы только из кеша
+        body_filter -- функция создания фильтра тела успешного ответа (filter_body)
+        """
+        cache_key = requests.Request("GET", url, params=params).prepare().url
+        entry = cache.get(cache_key)
+        if offline:
+            if entry is None:
+                raise LookupError(f"{cache_key} is not in the response cache")
+            return entry["body"]
+
+        response = self.get(url, endpoint=endpoint, params=params,
+                            headers=cache.get_conditional_headers(entry), body_filter=body_filter)
+        if response.status_code == 304 and entry is not None:
+            metrics.inc("http_not_modified_total", endpoint=endpoint)
+            return entry["body"]
+
+        body = response.content.decode("utf-8")
+        if not cache.put(cache_key, response.headers, body, entry):
+            metrics.inc("http_unchanged_total", endpoint=endpoint)
+        return body
@@ -110,6 +110,7 @@ CREATE TABLE "petitions" (
   "decision_message_kk" text,
   "decision_message_ru" text,
   "decision_reply_date" timestamp,
+  "record_hash" text,
   PRIMARY KEY ("id"),
   CONSTRAINT "FK_petitions.cover_file_id"
     FOREIGN KEY ("cover_file_id")
@@ -146,11 +147,14 @@ CREATE TABLE "signers" (
   "petition_uuid" uuid,
   "fio" text,
   "created_date" timestamp,
-  PRIMARY KEY ("id"),
+  "ordinal" int NOT NULL DEFAULT 0,
+  PRIMARY KEY ("id", "created_date"),
   CONSTRAINT "FK_signers.petition_uuid"
     FOREIGN KEY ("petition_uuid")
       REFERENCES "petitions"("uuid")
-);
+) PARTITION BY RANGE ("created_date");
+
+CREATE TABLE "signers_default" PARTITION OF "signers" DEFAULT;
 
 CREATE TABLE "comments" (
   "id" serial,
@@ -183,3 +187,12 @@ CREATE TABLE "decision_files" (
       REFERENCES "files"("id")
 );
 
+CREATE INDEX "petition_files_petition_id_idx" ON "petition_files" ("petition_id");
+
+CREATE INDEX "decision_files_petition_id_idx" ON "decision_files" ("petition_id");
+
+CREATE INDEX "signers_created_date_idx" ON "signers" USING brin ("created_date");
+
+CREATE INDEX "signers_petition_uuid_idx" ON "signers" ("petition_uuid");
+
+CREATE UNIQUE INDEX "signers_natural_key_idx" ON "signers" ("petition_uuid", "fio", "created_date", "ordinal");
@@ -0,0 +1,216 @@
+import base64
+import hashlib
+
+BASE64_ALPHABET = b"ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/="
+
+NOT_BASE64 = bytes(set(range(256)) - set(BASE64_ALPHABET))
+
+JSON_ESCAPES = {ord("/"): b"/", ord("\\"): b"\\", ord('"'): b'"', ord("b"): b"\b",
+                ord("f"): b"\f", ord("n"): b"\n", ord("r"): b"\r", ord("t"): b"\t"}
+
+SCAN, STRING, SKIP = range(3)
+
+
+class JsonFieldFilter:
+    def __init__(self, path, digest=False):
+        """
+        Инициализация потокового фильтра JSON, заменяющего строковое значение
+        поля на null по мере чтения тела ответа, не храня значение в памяти.
+        Разбирается только структура JSON: строки пропускаются поиском кавычки.
+        С digest значение считается base64 и после null добавляются поля
+        <поле>Size и <поле>Sha256 с размером и sha256 декодированных данных
+
+        Arguments:
+        path -- tuple ключей поля от корневого объекта, например ("cover", "fileData")
+        digest -- добавлять размер и sha256 удаленных данных
+        """
+        self.path = [key.encode("utf-8") for key in path]
+        self.digest = digest
+        # ключи открытых объектов, None для массивов
+        self.keys = []
+        self.expect_key = False
+        self.state = SCAN
+        self.escape = False
+        self.key = None
+        self.data_size = 0
+        self.data_hash = None
+        self.data_buffer = b""
+        self.input_size = 0
+
+
+    def filter(self, chunks):
+        """
+        Фильтрация всего тела, возвращает отфильтрованное тело (bytes)
+
+        Arguments:
+        chunks -- итератор частей тела (bytes)
+        """
+        return b"".join(self.feed(chunk) for chunk in chunks)
+
+
+    def feed(self, chunk):
+        """
+        Фильтрация очередной части тела, возвращает отфильтрованную часть (bytes)
+
+        Arguments:
+        chunk -- часть тела (bytes)
+        """
+        self.input_size += len(chunk)
+        output = bytearray()
+        i = 0
+        while i < len(chunk):
+            if self.state == SCAN:
+                i = self.scan(chunk, i, output)
+            else:
+                i = self.read_string(chunk, i, output)
+        return bytes(output)
+
+
+    def scan(self, chunk, i, output):
+        """
+        Разбор структуры JSON вне строк до начала строки или конца части.
+        Возвращает позицию следующего неразобранного байта
+
+        Arguments:
+        chunk -- часть тела
+        i -- позиция начала разбора
+        output -- bytearray отфильтрованного тела
+        """
+        start = i
+        while i < len(chunk):
+            byte = chunk[i]
+            if byte == ord('"'):
+                output += chunk[start:i]
+                if self.expect_key:
+                    self.key = bytearray()
+                    self.state = STRING
+                    output.append(byte)
+                elif self.keys == self.path:
+                    self.start_skip()
+                else:
+                    self.key = None
+                    self.state = STRING
+                    output.append(byte)
+                return i + 1
+            if byte == ord("{"):
+                self.keys.append(b"")
+                self.expect_key = True
+            elif byte == ord("["):
+                self.keys.append(None)
+            elif byte in (ord("}"), ord("]")):
+                self.keys.pop()
+                self.expect_key = False
+            elif byte == ord(","):
+                self.expect_key = bool(self.keys) and self.keys[-1] is not None
+            elif byte == ord(":"):
+                self.expect_key = False
+            i += 1
+        output += chunk[start:i]
+        return i
+
+
+    def read_string(self, chunk, i, output):
+        """
+        Пропуск строки до закрывающей кавычки или конца части: обычная строка
+        копируется в отфильтрованное тело, ключ запоминается, а значение
+        фильтруемого поля отбрасывается. Возвращает позицию следующего байта
+
+        Arguments:
+        chunk -- часть тела
+        i -- позиция начала строки в части
+        output -- bytearray отфильтрованного тела
+        """
+        if self.escape:
+            self.escape = False
+            self.add_string_part(chunk[i:i + 1], JSON_ESCAPES.get(chunk[i], b""), output)
+            return i + 1
+        quote = chunk.find(b'"', i)
+        backslash = chunk.find(b"\\", i, len(chunk) if quote == -1 else quote)
+        if backslash != -1:
+            self.add_string_part(chunk[i:backslash + 1], chunk[i:backslash], output)
+            self.escape = True
+            return backslash + 1
+        if quote == -1:
+            self.add_string_part(chunk[i:], chunk[i:], output)
+            return len(chunk)
+        self.add_string_part(chunk[i:quote + 1], chunk[i:quote], output)
+        self.end_string(output)
+        return quote + 1
+
+
+    def add_string_part(self, raw, value, output):
+        """
+        Добавление части строки
+
+        Arguments:
+        raw -- часть строки как в JSON
+        value -- часть значения строки для ключа и данных фильтруемого поля
+        output -- bytearray отфильтрованного тела
+        """
+        if self.state == SKIP:
+            if self.digest:
+                self.add_data(value)
+            return
+        output += raw
+        if self.key is not None:
+            self.key += value
+
+
+    def end_string(self, output):
+        """
+        Завершение строки: запоминание ключа, либо замена значения фильтруемого поля
+
+        Arguments:
+        output -- bytearray отфильтрованного тела
+        """
+        if self.state == SKIP:
+            self.end_skip(output)
+        elif self.key is not None:
+            self.keys[-1] = bytes(self.key)
+            self.key = None
+        self.state = SCAN
+
+
+    def start_skip(self):
+        """
+        Начало пропуска значения фильтруемого поля
+        """
+        self.state = SKIP
+        self.data_size = 0
+        self.data_hash = hashlib.sha256()
+        self.data_buffer = b""
+
+
+    def add_data(self, value):
+        """
+        Декодирование очередной части base64 значения фильтруемого поля
+        в размер и хеш данных. Символы вне алфавита base64 пропускаются,
+        остаток меньше 4 символов ждет следующей части
+
+        Arguments:
+        value -- часть значения поля
+        """
+        self.data_buffer += value.translate(None, NOT_BASE64)
+        length = len(self.data_buffer) // 4 * 4
+        if length:
+            data = base64.b64decode(self.data_buffer[:length])
+            self.data_size += len(data)
+            self.data_hash.update(data)
+            self.data_buffer = self.data_buffer[length:]
+
+
+    def end_skip(self, output):
+        """
+        Замена значения фильтруемого поля на null и, с digest, добавление
+        полей размера и хеша данных
+
+        Arguments:
+        output -- bytearray отфильтрованного тела
+        """
+        output += b"null"
+        if self.digest:
+            if len(self.data_buffer) % 4 > 1:
+                self.add_data(b"=" * (-len(self.data_buffer) % 4))
+            name = self.path[-1]
+            output += b',"%sSize":%d,"%sSha256":"%s"' % (name, self.data_size, name,
+                                                        self.data_hash.hexdigest().encode("ascii"))
@@ -0,0 +1,232 @@
+import atexit
+import bisect
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+STAGE_METRIC = "stage_seconds"
+
+
+def format_labels(labels, extra=()):
+    """
+    Форматирование меток метрики для текстового формата Prometheus
+
+    Arguments:
+    labels -- tuple пар (имя, значение) меток
+    extra -- дополнительные пары меток
+    """
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    values = ",".join('{}="{}"'.format(name, str(value).replace("\\", "\\\\")
+                                       .replace('"', '\\"').replace("\n", "\\n"))
+                      for name, value in pairs)
+    return "{" + values + "}"
+
+
+class Metrics:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        """
+        Инициализация реестра метрик: счетчиков и гистограмм с метками.
+        Метрики потокобезопасны и выгружаются в текстовом формате Prometheus
+        или в JSON
+
+        Arguments:
+        buckets -- верхние границы корзин гистограмм в секундах
+        """
+        self.buckets = tuple(buckets)
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+
+
+    def inc(self, name, value=1, **labels):
+        """
+        Увеличение счетчика
+
+        Arguments:
+        name -- имя счетчика
+        value -- величина увеличения
+        labels -- метки счетчика
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+
+    def observe(self, name, value, **labels):
+        """
+        Добавление значения в гистограмму
+
+        Arguments:
+        name -- имя гистограммы
+        value -- значение, для времени - в секундах
+        labels -- метки гистограммы
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = {"buckets": [0] * (len(self.buckets) + 1),
+                                                    "count": 0, "sum": 0.0, "max": 0.0}
+            histogram["buckets"][bisect.bisect_left(self.buckets, value)] += 1
+            histogram["count"] += 1
+            histogram["sum"] += value
+            histogram["max"] = max(histogram["max"], value)
+
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """
+        Измерение времени выполнения блока with в гистограмму, в том числе при ошибке
+
+        Arguments:
+        name -- имя гистограммы
+        labels -- метки гистограммы
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+
+    def stage(self, stage):
+        """
+        Измерение времени этапа запуска (план, парсинг, загрузка)
+
+        Arguments:
+        stage -- название этапа
+        """
+        return self.timer(STAGE_METRIC, stage=stage)
+
+
+    def reset(self):
+        """
+        Удаление всех метрик, например, унаследованных дочерним процессом от родителя
+        """
+        with self.lock:
+            self.counters = {}
+            self.histograms = {}
+
+
+    def get_state(self):
+        """
+        Получение копии всех метрик, например, для передачи из дочернего процесса
+        """
+        with self.lock:
+            return {"counters": dict(self.counters),
+                    "histograms": {key: dict(histogram, buckets=list(histogram["buckets"]))
+                                   for key, histogram in self.histograms.items()}}
+
+
+    def merge(self, state):
+        """
+        Добавление метрик, полученных get_state, например, из дочернего процесса
+
+        Arguments:
+        state -- метрики (get_state)
+        """
+        with self.lock:
+            for key, value in state["counters"].items():
+                self.counters[key] = self.counters.get(key, 0) + value
+            for key, other in state["histograms"].items():
+                histogram = self.histograms.get(key)
+                if histogram is None:
+                    self.histograms[key] = dict(other, buckets=list(other["buckets"]))
+                    continue
+                histogram["buckets"] = [a + b for a, b in zip(histogram["buckets"], other["buckets"])]
+                histogram["count"] += other["count"]
+                histogram["sum"] += other["sum"]
+                histogram["max"] = max(histogram["max"], other["max"])
+
+
+    def to_prometheus(self, stages=False):
+        """
+        Выгрузка метрик в текстовом формате Prometheus
+
+        Arguments:
+        stages -- выгружать время этапов запуска
+        """
+        state = self.get_state()
+        lines = []
+        for name in sorted({name for name, _ in state["counters"]}):
+            lines.append(f"# TYPE {name} counter")
+            for (counter_name, labels), value in sorted(state["counters"].items()):
+                if counter_name == name:
+                    lines.append(f"{name}{format_labels(labels)} {value}")
+        for name in sorted({name for name, _ in state["histograms"]}):
+            if name == STAGE_METRIC and not stages:
+                continue
+            lines.append(f"# TYPE {name} histogram")
+            for (histogram_name, labels), histogram in sorted(state["histograms"].items()):
+                if histogram_name != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(self.buckets + ("+Inf",), histogram["buckets"]):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{format_labels(labels, [('le', bound)])} {cumulative}")
+                lines.append(f"{name}_sum{format_labels(labels)} {histogram['sum']}")
+                lines.append(f"{name}_count{format_labels(labels)} {histogram['count']}")
+        return "\n".join(lines) + "\n"
+
+
+    def to_json(self, stages=False):
+        """
+        Получение сводки метрик для JSON: значения счетчиков, количество,
+        сумма, среднее и максимум гистограмм, и время этапов запуска
+
+        Arguments:
+        stages -- добавлять время этапов запуска
+        """
+        state = self.get_state()
+        summary = {"counters": {}, "histograms": {}}
+        for (name, labels), value in sorted(state["counters"].items()):
+            summary["counters"].setdefault(name, {})[format_labels(labels)[1:-1]] = value
+        for (name, labels), histogram in sorted(state["histograms"].items()):
+            if name == STAGE_METRIC:
+                continue
+            summary["histograms"].setdefault(name, {})[format_labels(labels)[1:-1]] = {
+                "count": histogram["count"], "sum": histogram["sum"],
+                "avg": histogram["sum"] / histogram["count"], "max": histogram["max"]}
+        if stages:
+            summary["stages"] = {dict(labels)["stage"]: histogram["sum"]
+                                 for (name, labels), histogram in sorted(state["histograms"].items())
+                                 if name == STAGE_METRIC}
+        return summary
+
+
+    def save(self, path, stages=False):
+        """
+        Сохранение метрик в файл: JSON сводка для файла .json,
+        иначе текстовый формат Prometheus (node_exporter textfile collector)
+
+        Arguments:
+        path -- путь к файлу
+        stages -- сохранять время этапов запуска
+        """
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            if path.endswith(".json"):
+                json.dump(self.to_json(stages), f, ensure_ascii=False, indent=2)
+            else:
+                f.write(self.to_prometheus(stages))
+        os.replace(tmp_path, path)
+
+
+    def save_at_exit(self, path, stages=False):
+        """
+        Сохранение метрик в файл при завершении процесса, в том числе после ошибки
+
+        Arguments:
+        path -- путь к файлу
+        stages -- сохранять время этапов запуска
+        """
+        atexit.register(self.save, path, stages)
+
+
+metrics = Metrics()
@@ -0,0 +1,373 @@
+import json
+import base64
+import hashlib
+import random
+import threading
+import time
+import uuid
+import collections
+from datetime import datetime
+from datetime import timedelta
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+API_PATH = "/api/public/v1/petitions"
+
+
+def get_uuid(kind, number):
+    """
+    Получение детерминированного uuid синтетической записи
+
+    Arguments:
+    kind -- номер вида записи (петиция, комментарий, файл, ...)
+    number -- номер записи
+    """
+    return str(uuid.UUID(int=(kind << 96) | number))
+
+
+class MockApiData:
+    def __init__(self, petitions_count=100, max_signers=1000, max_comments=50,
+                 cover_size=64 * 1024, bad_signers_rate=0.0, seed=0):
+        """
+        Инициализация синтетических данных API epetition.kz. Подписи и комментарии
+        не хранятся, а вычисляются по номеру петиции и позиции записи, поэтому
+        размер данных ограничен только параметрами
+
+        Arguments:
+        petitions_count -- количество петиций
+        max_signers -- максимальное количество подписей одной петиции
+        max_comments -- максимальное количество комментариев одной петиции
+        cover_size -- размер файла обложки петиции в байтах
+        bad_signers_rate -- доля петиций с одной сбойной подписью, страницы
+                            подписей с ней всегда отвечают ошибкой 500
+        seed -- начальное значение генератора случайных чисел
+        """
+        self.seed = seed
+        self.cover_data = base64.b64encode(bytes(range(256)) * (cover_size // 256)).decode("ascii")
+        self.created_date = datetime.now().replace(microsecond=0) - timedelta(days=1)
+        self.petitions = []
+        for k in range(petitions_count):
+            rnd = random.Random(seed * 1000003 + k)
+            signers_count = rnd.randint(0, max_signers)
+            bad_position = None
+            if signers_count > 0 and rnd.random() < bad_signers_rate:
+                bad_position = rnd.randrange(signers_count)
+            self.petitions.append({"id": get_uuid(1, k),
+                                   "state": rnd.choice(["ACTIVE", "ACTIVE", "ACTIVE", "CLOSED", "DECIDED"]),
+                                   "deadline": (self.created_date + timedelta(days=rnd.randint(-60, 60))).isoformat(),
+                                   "signersCount": signers_count,
+                                   "commentsCount": rnd.randint(0, max_comments),
+                                   "badPosition": bad_position})
+        self.indexes = {f["id"]: k for k, f in enumerate(self.petitions)}
+
+
+    def get_page(self, items_count, get_item, size, page):
+        """
+        Получение страницы списка в формате API
+
+        Arguments:
+        items_count -- количество элементов списка
+        get_item -- функция получения элемента по позиции
+        size -- размер страницы
+        page -- номер страницы
+        """
+        positions = range(page * size, min((page + 1) * size, items_count))
+        return {"content": [get_item(f) for f in positions],
+                "last": (page + 1) * size >= items_count,
+                "totalElements": items_count,
+                "size": size,
+                "number": page}
+
+
+    def get_short_petitions_page(self, size, page):
+        """
+        Получение страницы списка кратких петиций
+
+        Arguments:
+        size -- размер страницы
+        page -- номер страницы
+        """
+        def get_short_petition(k):
+            petition = self.petitions[k]
+            return {"id": petition["id"], "title": f"Petition {k}", "state": petition["state"],
+                    "deadline": petition["deadline"], "signersCount": petition["signersCount"]}
+        return self.get_page(len(self.petitions), get_short_petition, size, page)
+
+
+    def get_file(self, number, with_data=False):
+        """
+        Получение синтетического файла
+
+        Arguments:
+        number -- номер файла
+        with_data -- добавлять содержимое файла (fileData)
+        """
+        file = {"fileId": get_uuid(3, number), "fileName": f"file_{number}.pdf",
+                "fileHash": hashlib.md5(str(number).encode("ascii")).hexdigest(),
+                "mimeType": "application/pdf"}
+        if with_data:
+            file["fileName"] = f"cover_{number}.png"
+            file["mimeType"] = "image/png"
+            file["fileData"] = self.cover_data
+        return file
+
+
+    def get_petition(self, petition_id):
+        """
+        Получение полной петиции, None если петиции нет
+
+        Arguments:
+        petition_id -- id петиции
+        """
+        k = self.indexes.get(petition_id)
+        if k is None:
+            return None
+        petition = self.petitions[k]
+        rnd = random.Random(self.seed * 1000003 + k)
+        org_number = rnd.randrange(10)
+        location_number = org_number % 5
+        decision = None
+        if petition["state"] == "DECIDED":
+            decision = {"messageKk": f"Шешім {k}", "messageRu": f"Решение {k}",
+                        "replyDate": (self.created_date - timedelta(days=1)).isoformat(),
+                        "files": [self.get_file(3 * k + 2)]}
+        return {
+            "id": petition_id,
+            "title": f"Petition {k}",
+            "description": f"Description of petition {k}\nwith \"quotes\", commas and\ttabs",
+            "regNumber": f"REG-{k:06d}",
+            "state": petition["state"],
+            "source": rnd.choice(["WEB", "MOBILE"]),
+            "applyDate": (self.created_date - timedelta(days=90)).isoformat(),
+            "deadline": petition["deadline"],
+            "signersCount": petition["signersCount"],
+            "requiredCount": 50000,
+            "viewersCount": rnd.randint(0, 100000),
+            "lang": rnd.choice(["RU", "KK"]),
+            "applicant": {"firstName": f"Name{k}", "lastName": f"Surname{k}"},
+            "organization": {
+                "id": get_uuid(4, org_number), "nameRu": f"Организация {org_number}",
+                "nameKk": f"Ұйым {org_number}", "parentId": None, "path": f"/{org_number}",
+                "hasUnit": org_number % 2 == 0,
+                "orgType": {"id": get_uuid(5, org_number % 3), "nameRu": f"Тип {org_number % 3}",
+                            "nameKk": f"Түрі {org_number % 3}", "isUnit": False, "acceptAppeal": True},
+                "location": {"id": get_uuid(6, location_number), "parentId": None,
+                             "nameRu": f"Регион {location_number}", "nameKk": f"Аймақ {location_number}",
+                             "type": "REGION", "path": f"/{location_number}",
+                             "externalId": str(location_number), "externalParentId": None,
+                             "katoCode": f"{location_number:09d}"},
+            },
+            "location": {"positionLatitude": "51.1", "positionLongitude": "71.4",
+                         "positionAddress": f"Address {k}"},
+            "cover": self.get_file(3 * k, with_data=True),
+            "files": [self.get_file(3 * k + 1)],
+            "decision": decision,
+        }
+
+
+    def get_signers_page(self, petition_id, size, page):
+        """
+        Получение страницы подписей петиции, новые подписи первыми.
+        None, если страница содержит сбойную подпись
+
+        Arguments:
+        petition_id -- id петиции
+        size -- размер страницы
+        page -- номер страницы
+        """
+        k = self.indexes[petition_id]
+        petition = self.petitions[k]
+        bad_position = petition["badPosition"]
+        if bad_position is not None and page * size <= bad_position < (page + 1) * size:
+            return None
+
+        def get_signer(position):
+            return {"fio": f"Подписант {k}-{position}",
+                    "createdDate": (self.created_date - timedelta(minutes=position)).isoformat() + ".000"}
+        return self.get_page(petition["signersCount"], get_signer, size, page)
+
+
+    def get_comments_page(self, petition_id, size, page):
+        """
+        Получение страницы комментариев петиции, новые комментарии первыми.
+        Каждый третий комментарий - ответ на предыдущий по времени комментарий
+
+        Arguments:
+        petition_id -- id петиции
+        size -- размер страницы
+        page -- номер страницы
+        """
+        k = self.indexes[petition_id]
+        comments_count = self.petitions[k]["commentsCount"]
+
+        def get_comment(position):
+            number = k * 1000000 + position
+            parent_id = None
+            if position % 3 == 0 and position + 1 < comments_count:
+                parent_id = get_uuid(2, number + 1)
+            return {"id": get_uuid(2, number), "petitionId": petition_id, "parentId": parent_id,
+                    "fio": f"Комментатор {position}", "comment": f"Комментарий {position}, \"текст\"",
+                    "repliesCount": 0,
+                    "createdDate": (self.created_date - timedelta(minutes=position)).isoformat() + ".000"}
+        return self.get_page(comments_count, get_comment, size, page)
+
+
+class MockApiServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, data, latency=0.0, error_rate=0.0, timeout_rate=0.0, timeout_delay=30.0):
+        """
+        Инициализация локального HTTP сервера, заменяющего API epetition.kz
+        с внесением задержек, зависаний и ошибок
+
+        Arguments:
+        address -- пара (хост, порт), порт 0 - любой свободный
+        data -- синтетические данные (MockApiData)
+        latency -- средняя задержка ответа в секундах
+        error_rate -- доля ответов 503, которые клиент должен повторить
+        timeout_rate -- доля запросов, ответ на которые задерживается на timeout_delay
+        timeout_delay -- задержка зависших запросов в секундах
+        """
+        super().__init__(address, MockApiHandler)
+        self.data = data
+        self.latency = latency
+        self.error_rate = error_rate
+        self.timeout_rate = timeout_rate
+        self.timeout_delay = timeout_delay
+        self.lock = threading.Lock()
+        self.requests_count = collections.Counter()
+
+
+    def get_api_url(self):
+        """
+        Получение API url сервера для парсеров
+        """
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}{API_PATH}"
+
+
+    def count_request(self, endpoint):
+        with self.lock:
+            self.requests_count[endpoint] += 1
+
+
+    def get_requests_count(self):
+        """
+        Получение количества запросов по эндпоинтам
+        """
+        with self.lock:
+            return dict(self.requests_count)
+
+
+class MockApiHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # заголовки и тело отправляются отдельно, без TCP_NODELAY keep-alive
+    # ответы задерживаются алгоритмом Нейгла на время delayed ACK клиента
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+
+    def send_json(self, status, body):
+        """
+        Отправка JSON ответа. Ответ с ETag, совпадающим с If-None-Match запроса,
+        заменяется ответом 304
+
+        Arguments:
+        status -- статус ответа
+        body -- тело ответа
+        """
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        etag = '"' + hashlib.sha256(data).hexdigest()[:32] + '"'
+        if status == 200 and self.headers.get("If-None-Match") == etag:
+            status, data = 304, b""
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        if status in (200, 304):
+            self.send_header("ETag", etag)
+        self.end_headers()
+        self.wfile.write(data)
+
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = {key: int(values[0]) for key, values in parse_qs(url.query).items()}
+        parts = url.path[len(API_PATH):].strip("/").split("/")
+        endpoint = parts[-1] if parts[-1] in ("short", "signers", "comments") else "petition"
+        server = self.server
+        server.count_request(endpoint)
+
+        if server.latency > 0:
+            time.sleep(random.uniform(0, 2 * server.latency))
+        try:
+            if random.random() < server.timeout_rate:
+                time.sleep(server.timeout_delay)
+                return self.send_json(504, {"error": "Gateway Timeout"})
+            if random.random() < server.error_rate:
+                return self.send_json(503, {"error": "Service Unavailable"})
+
+            data = server.data
+            size, page = query.get("size", 10), query.get("page", 0)
+            if not url.path.startswith(API_PATH) or parts[0] == "" or len(parts) > 2:
+                return self.send_json(404, {"error": "Not Found"})
+            if endpoint == "short":
+                return self.send_json(200, data.get_short_petitions_page(size, page))
+            if parts[0] not in data.indexes:
+                return self.send_json(404, {"error": "Not Found"})
+            if endpoint == "signers":
+                signers_page = data.get_signers_page(parts[0], size, page)
+                if signers_page is None:
+                    return self.send_json(500, {"error": "Internal Server Error"})
+                return self.send_json(200, signers_page)
+            if endpoint == "comments":
+                return self.send_json(200, data.get_comments_page(parts[0], size, page))
+            return self.send_json(200, data.get_petition(parts[0]))
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+def start_mock_api_server(data, host="127.0.0.1", port=0, **faults):
+    """
+    Запуск сервера в отдельном потоке. Возвращает сервер (MockApiServer),
+    остановка - server.shutdown()
+
+    Arguments:
+    data -- синтетические данные (MockApiData)
+    host -- хост сервера
+    port -- порт сервера, 0 - любой свободный
+    faults -- параметры задержек и ошибок MockApiServer
+    """
+    server = MockApiServer((host, port), data, **faults)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+if __name__ == "__main__":
+    import argparse
+    arg_parser = argparse.ArgumentParser(prog="mock api server")
+    arg_parser.add_argument("--host", default="127.0.0.1")
+    arg_parser.add_argument("--port", type=int, default=8000)
+    arg_parser.add_argument("--petitions", type=int, default=100, help="количество петиций")
+    arg_parser.add_argument("--max-signers", type=int, default=1000,
+                            help="максимальное количество подписей одной петиции")
+    arg_parser.add_argument("--max-comments", type=int, default=50,
+                            help="максимальное количество комментариев одной петиции")
+    arg_parser.add_argument("--cover-size", type=int, default=64 * 1024,
+                            help="размер файла обложки петиции в байтах")
+    arg_parser.add_argument("--bad-signers-rate", type=float, default=0.0,
+                            help="доля петиций со сбойной подписью (ошибка 500)")
+    arg_parser.add_argument("--latency", type=float, default=0.0, help="средняя задержка ответа в секундах")
+    arg_parser.add_argument("--error-rate", type=float, default=0.0, help="доля ответов 503")
+    arg_parser.add_argument("--timeout-rate", type=float, default=0.0, help="доля зависающих запросов")
+    arg_parser.add_argument("--timeout-delay", type=float, default=30.0,
+                            help="задержка зависающих запросов в секундах")
+    arg_parser.add_argument("--seed", type=int, default=0)
+    args = arg_parser.parse_args()
+
+    data = MockApiData(args.petitions, args.max_signers, args.max_comments, args.cover_size,
+                       args.bad_signers_rate, args.seed)
+    server = MockApiServer((args.host, args.port), data, latency=args.latency, error_rate=args.error_rate,
+                           timeout_rate=args.timeout_rate, timeout_delay=args.timeout_delay)
+    print(f"serving {server.get_api_url()}")
+    server.serve_forever()
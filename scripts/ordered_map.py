@@ -0,0 +1,34 @@
+import collections
+from concurrent.futures import ThreadPoolExecutor
+
+
+def map_in_order(function, items, workers=1):
+    """
+    Применение функции к элементам в нескольких потоках с сохранением порядка
+    результатов. Одновременно выполняется до workers вызовов, вперед забирается
+    не больше 2 * workers элементов, поэтому items может быть ленивым итератором.
+    При workers <= 1 функция вызывается в текущем потоке. Генератор результатов
+
+    Arguments:
+    function -- функция одного элемента
+    items -- итерируемые элементы
+    workers -- количество потоков
+    """
+    if workers <= 1:
+        for item in items:
+            yield function(item)
+        return
+
+    executor = ThreadPoolExecutor(max_workers=workers)
+    try:
+        in_flight = collections.deque()
+        for item in items:
+            in_flight.append(executor.submit(function, item))
+            if len(in_flight) >= 2 * workers:
+                yield in_flight.popleft().result()
+        while in_flight:
+            yield in_flight.popleft().result()
+    except BaseException:
+        executor.shutdown(wait=False, cancel_futures=True)
+        raise
+    executor.shutdown()
@@ -0,0 +1,48 @@
+import queue
+from concurrent.futures import ThreadPoolExecutor
+
+
+def load_in_parallel(pool, workers, items, create_loader, load_item):
+    """
+    Загрузка независимых элементов (файлов, частей файлов) в базу данных
+    в нескольких потоках, каждый поток со своим соединением из пула и своим
+    загрузчиком. Загрузчики создаются по очереди до запуска потоков, чтобы
+    проверки схемы базы данных в конструкторах не выполнялись одновременно.
+    При ошибке в одном потоке остальные дорабатывают очередь, затем
+    пробрасывается первая ошибка. Возвращает dict результатов load_item по элементам
+
+    Arguments:
+    pool -- пул соединений (psycopg2.pool.ThreadedConnectionPool) не меньше чем на workers соединений
+    workers -- количество потоков
+    items -- list элементов для загрузки
+    create_loader -- функция, создающая загрузчик по соединению
+    load_item -- функция загрузки элемента загрузчиком, load_item(loader, item)
+    """
+    items_queue = queue.Queue()
+    for item in items:
+        items_queue.put(item)
+
+    def work(loader):
+        results = {}
+        while True:
+            try:
+                item = items_queue.get_nowait()
+            except queue.Empty:
+                return results
+            results[item] = load_item(loader, item)
+
+    connections = [pool.getconn() for _ in range(workers)]
+    try:
+        loaders = [create_loader(conn) for conn in connections]
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(work, loader) for loader in loaders]
+        for future in futures:
+            if future.exception() is not None:
+                raise future.exception()
+        results = {}
+        for future in futures:
+            results.update(future.result())
+        return results
+    finally:
+        for conn in connections:
+            pool.putconn(conn)
@@ -1,10 +1,16 @@
-import requests
 import json
-import csv
 from datetime import datetime
 import os
 import itertools
 import errno
+from concurrent.futures import ThreadPoolExecutor
+from http_client import HttpClient, parse_concurrency
+from ordered_map import map_in_order
+from json_stream_filter import JsonFieldFilter
+from response_cache import ResponseCache
+from checkpoint_journal import CheckpointJournal, truncate_file
+from record_files import RECORD_FILE_FORMATS, get_record_file_format, open_stream_writer, iterate_records
+from metrics import metrics
 
 def silent_remove(filename):
     try:
@@ -15,21 +21,40 @@ def silent_remove(filename):
 
 
 class PetitionsParser:
-    def __init__(self, api_url="https://epetition.kz/api/public/v1/petitions"):
+    def __init__(self, api_url="https://epetition.kz/api/public/v1/petitions", workers=1, client=None,
+                 cache=None, offline=False, fsync=False, concurrency=None, cover_digest=False):
         """
         Инициализация парсера петиций
 
         Arguments:
         api_url -- API url для получения петиций
+        workers -- количество одновременных запросов петиций
+        client -- HTTP клиент (HttpClient), по умолчанию создается новый
+        cache -- дисковый кеш ответов (ResponseCache), None - без кеша
+        offline -- брать ответы только из кеша, без запросов к API
+        fsync -- сбрасывать файл записей на диск в контрольных точках
+        concurrency -- dict максимального количества одновременных запросов по эндпоинтам;
+                       для запросов петиций, если не задано, используется workers
+        cover_digest -- сохранять в обложке петиции размер и sha256 файла обложки
+                        (fileDataSize, fileDataSha256)
         """
         self.api_url = api_url
-        self.timeout = 1
+        self.workers = workers
+        self.cache = cache
+        self.offline = offline
+        self.fsync = fsync
+        self.cover_digest = cover_digest
         self.max_page_size = 10
         self.headers = {
             'Accept': 'application/json',
             'Content-Type': 'application/json',
             'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_10_1) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/39.0.2171.95 Safari/537.36'
         }
+        self.client = client or HttpClient(headers=self.headers,
+                                           timeouts={"short": 3, "petition": 5},
+                                           pool_size=max(10, workers + 1),
+                                           concurrency={"petition": workers, **(concurrency or {})})
+        self.journal = CheckpointJournal("petitions_parser.journal")
 
 
     def remove_cover_file_from_petition(self, petition):
@@ -43,24 +68,39 @@ class PetitionsParser:
             petition["cover"].pop("fileData", None)
 
 
+    def create_cover_filter(self):
+        """
+        Создание потокового фильтра ответа петиции, отбрасывающего файл обложки
+        (cover.fileData) во время чтения ответа
+        """
+        return JsonFieldFilter(("cover", "fileData"), digest=self.cover_digest)
+
+
+    def fetch_json(self, url, endpoint, params=None, body_filter=None):
+        """
+        Получение json ответа API, через кеш ответов, если он задан
+
+        Arguments:
+        url -- адрес запроса
+        endpoint -- название эндпоинта
+        params -- параметры запроса
+        body_filter -- функция создания фильтра тела ответа (JsonFieldFilter)
+        """
+        if self.cache is None:
+            return self.client.get(url, endpoint=endpoint, params=params, body_filter=body_filter).json()
+        return json.loads(self.client.get_cached(url, self.cache, endpoint=endpoint, params=params,
+                                                 offline=self.offline, body_filter=body_filter))
+
+
     def fetch_petition(self, petition_id):
         """
-        Получение петиции из API
+        Получение петиции из API, файл обложки отбрасывается во время чтения ответа
 
         Arguments:
         petition_id -- id петиции
         """
-        while True:
-            try:
-                response = requests.get(f"{self.api_url}/{petition_id}",
-                                        headers=self.headers,
-                                        timeout=self.timeout)
-                response.raise_for_status()
-                break
-            except (requests.exceptions.Timeout,
-                    requests.exceptions.ConnectionError):
-                continue
-        return response.json()
+        return self.fetch_json(f"{self.api_url}/{petition_id}", endpoint="petition",
+                               body_filter=self.create_cover_filter)
 
 
     def fetch_petition_list_page(self, size, page):
@@ -71,72 +111,171 @@ class PetitionsParser:
         size -- размер одной страницы списка
         page -- номер страницы списка
         """
-        while True:
-            try:
-                response = requests.get(f"{self.api_url}/short",
-                                        params={"size":size, "page":page},
-                                        headers=self.headers,
-                                        timeout=self.timeout)
-                response.raise_for_status()
-                break
-            except (requests.exceptions.Timeout,
-                    requests.exceptions.ConnectionError):
-                continue
-        return response.json()
+        return self.fetch_json(f"{self.api_url}/short", endpoint="short",
+                               params={"size":size, "page":page})
 
 
-    def save_to_csv(self, petition, csv_path):
+    def fetch_petition_without_cover(self, petition_id):
         """
-        Сохранение петиции в CSV файл
+        Получение петиции из API без файла обложки
 
         Arguments:
-        petition -- петиция в формате json
-        csv_path -- путь к CSV файлу
+        petition_id -- id петиции
         """
-        field_names = petition.keys()
-        
-        with open(csv_path, 'a', newline='', encoding='utf-8') as csv_file:
-            writer = csv.DictWriter(csv_file, fieldnames=field_names)
-            
-            if os.path.getsize(csv_path) == 0:
-                writer.writeheader()
-            writer.writerow(petition)
+        petition = self.fetch_petition(petition_id)
+        self.remove_cover_file_from_petition(petition)
+        return petition
+
+
+    def iterate_petition_list(self, start_page=0):
+        """
+        Перебор кратких петиций из списка, следующая страница списка
+        запрашивается заранее, пока обрабатывается текущая
+
+        Arguments:
+        start_page -- номер первой страницы списка
+        """
+        with ThreadPoolExecutor(max_workers=1) as pager:
+            next_page = pager.submit(self.fetch_petition_list_page, self.max_page_size, start_page)
+            for i in itertools.count(start_page + 1):
+                petition_list_page = next_page.result()
+                if not petition_list_page["last"]:
+                    next_page = pager.submit(self.fetch_petition_list_page, self.max_page_size, i)
+
+                yield from petition_list_page["content"]
+
+                if petition_list_page["last"]:
+                    break
+
+
+    def fetch_petitions(self, start_page=0, skip_ids=frozenset()):
+        """
+        Получение всех петиций из API в порядке списка петиций.
+        При workers > 1 одновременно выполняется до workers запросов петиций,
+        порядок результатов при этом сохраняется
+
+        Arguments:
+        start_page -- номер первой страницы списка петиций
+        skip_ids -- id петиций, которые не нужно запрашивать
+        """
+        short_petitions = (f for f in self.iterate_petition_list(start_page)
+                           if f["id"] not in skip_ids)
+        yield from map_in_order(
+            lambda short_petition: self.fetch_petition_without_cover(short_petition["id"]),
+            short_petitions, self.workers)
+
+
+    def get_resumable_csv_path(self):
+        """
+        Получение пути к файлу прерванного парсинга, None если его нет
+        """
+        state = self.journal.load()
+        return state["csvPath"] if state else None
+
 
+    def read_saved_petition_ids(self, csv_path, file_format=None):
+        """
+        Получение id петиций, уже сохраненных в файле записей
 
-    def run(self, csv_path):
+        Arguments:
+        csv_path -- путь к файлу записей
+        file_format -- формат файла: csv, ndjson или ndjson.gz
         """
-        Парсинг петиций и сохранение в CSV файле
+        if not os.path.exists(csv_path):
+            return set()
+        return {record["id"] for record in iterate_records(csv_path, file_format)}
+
+
+    def run(self, csv_path, sink=None):
+        """
+        Парсинг петиций и сохранение в файле записей, формат файла определяется
+        расширением: .csv, .ndjson или .ndjson.gz. Петиции пишутся во временный
+        файл csv_path.part, прогресс сохраняется в журнал, после сбоя повторный
+        запуск с тем же csv_path продолжает парсинг с места остановки.
+        С приемником sink петиции передаются загрузчику базы данных вместо файла,
+        журнал при этом не ведется: слияние петиций с базой данных повторяемо
         
         Arguments:
-        csv_path -- путь к CSV файлу
+        csv_path -- путь к файлу записей, с sink не используется
+        sink -- приемник записей (pipeline.QueueSink) вместо файла записей
         """
+        if sink is not None:
+            try:
+                with metrics.stage("petitions_crawl"):
+                    for petition in self.fetch_petitions():
+                        sink.write_row(petition)
+            finally:
+                sink.close()
+            return
+
+        file_format = get_record_file_format(csv_path)
+        part_path = csv_path + ".part"
+        state = self.journal.load()
+        if state is None or state["csvPath"] != csv_path or not truncate_file(part_path, state["size"]):
+            silent_remove(part_path)
+        saved_ids = self.read_saved_petition_ids(part_path, file_format)
         silent_remove(csv_path)
+        writer = open_stream_writer(part_path, file_format, fsync=self.fsync)
         try:
-            for i in itertools.count():
-                petition_list_page = self.fetch_petition_list_page(self.max_page_size, i)
-                
-                for short_petition in petition_list_page["content"]:
-                    petition = self.fetch_petition(short_petition["id"])
-                    self.remove_cover_file_from_petition(petition)
-                    self.save_to_csv(petition, csv_path)
-                
-                if petition_list_page["last"]:
-                    break
+            with metrics.stage("petitions_crawl"):
+                # список обходится с первой страницы: если из списка удалены петиции,
+                # несохраненные петиции сдвигаются на предыдущие страницы
+                for petition in self.fetch_petitions(skip_ids=saved_ids):
+                    writer.write_row(petition)
+                    if self.journal.is_due():
+                        self.journal.save({"csvPath": csv_path, "size": writer.checkpoint()})
         except:
-            silent_remove(csv_path)
+            self.journal.save({"csvPath": csv_path, "size": writer.checkpoint()})
             raise
+        finally:
+            writer.close()
+        os.replace(part_path, csv_path)
+        self.journal.clear()
 
 if __name__ == "__main__":
     import argparse
     arg_parser = argparse.ArgumentParser(prog="petitions parser")
     arg_parser.add_argument("-f", "--filename")
+    arg_parser.add_argument("-w", "--workers", type=int, default=8,
+                            help="количество одновременных запросов петиций")
+    arg_parser.add_argument("--cache-dir",
+                            help="директория дискового кеша ответов API")
+    arg_parser.add_argument("--cache-size", type=int, default=512,
+                            help="максимальный размер кеша в мегабайтах")
+    arg_parser.add_argument("--offline", action="store_true",
+                            help="брать ответы только из кеша, без запросов к API")
+    arg_parser.add_argument("--format", choices=RECORD_FILE_FORMATS, default="csv",
+                            help="формат файла записей")
+    arg_parser.add_argument("--concurrency", type=parse_concurrency, action="append", default=[],
+                            metavar="petition=N",
+                            help="максимальное количество одновременных запросов петиций, "
+                                 "количество подбирается по ответам сервера, по умолчанию -w")
+    arg_parser.add_argument("--cover-digest", action="store_true",
+                            help="сохранять размер и sha256 файла обложки петиции (fileDataSize, fileDataSha256)")
+    arg_parser.add_argument("--fsync", action="store_true",
+                            help="сбрасывать файл записей на диск в контрольных точках")
+    arg_parser.add_argument("--metrics-file",
+                            help="файл метрик, сохраняемый в конце запуска: .json - JSON сводка, иначе формат Prometheus")
+    arg_parser.add_argument("--metrics-stages", action="store_true",
+                            help="добавлять в файл метрик время этапов запуска")
     args = arg_parser.parse_args()
+    if set(dict(args.concurrency)) - {"petition"}:
+        arg_parser.error("--concurrency: only petition requests are sent concurrently")
+    if args.metrics_file:
+        metrics.save_at_exit(args.metrics_file, stages=args.metrics_stages)
     
-    parser = PetitionsParser()
+    cache = None
+    if args.cache_dir:
+        cache = ResponseCache(args.cache_dir, max_size=args.cache_size * 1024 * 1024)
+    parser = PetitionsParser(workers=args.workers, cache=cache, offline=args.offline,
+                             fsync=args.fsync, concurrency=dict(args.concurrency),
+                             cover_digest=args.cover_digest)
 
     if args.filename:
-        parser.run(f"{args.filename}.csv")
+        parser.run(f"{args.filename}.{args.format}")
+    elif parser.get_resumable_csv_path():
+        parser.run(parser.get_resumable_csv_path())
     else:
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        parser.run(f"petitions_{timestamp}.csv")
+        parser.run(f"petitions_{timestamp}.{args.format}")
 
@@ -0,0 +1,224 @@
+import json
+import csv
+import gzip
+import os
+import re
+import datetime
+import shutil
+from csv_writer import CsvStreamWriter
+from metrics import metrics
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+RECORD_FILE_FORMATS = ("csv", "ndjson", "ndjson.gz")
+
+
+def json_dumps(record):
+    """
+    Сериализация записи в JSON (bytes), через orjson, если он установлен
+
+    Arguments:
+    record -- запись (dict)
+    """
+    if orjson is not None:
+        return orjson.dumps(record)
+    return json.dumps(record, ensure_ascii=False).encode("utf-8")
+
+
+def json_loads(data):
+    """
+    Разбор JSON, через orjson, если он установлен
+
+    Arguments:
+    data -- JSON строка (str или bytes)
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def get_record_file_format(path):
+    """
+    Получение формата файла записей по расширению: ndjson.gz, ndjson или csv
+
+    Arguments:
+    path -- путь к файлу
+    """
+    if path.endswith(".ndjson.gz"):
+        return "ndjson.gz"
+    if path.endswith(".ndjson"):
+        return "ndjson"
+    return "csv"
+
+
+class NdjsonStreamWriter:
+    def __init__(self, path, compress=False, buffer_size=1000, fsync=False):
+        """
+        Инициализация буферизованной записи в NDJSON файл (одна JSON запись на строку).
+        При сжатии gzip в каждой контрольной точке закрывается отдельный gzip блок,
+        поэтому файл, обрезанный по контрольной точке, остается корректным
+
+        Arguments:
+        path -- путь к NDJSON файлу
+        compress -- сжимать файл gzip
+        buffer_size -- количество записей, после которого буфер сбрасывается в файл
+        fsync -- сбрасывать файл на диск (os.fsync) в контрольных точках
+        """
+        self.path = path
+        self.buffer_size = buffer_size
+        self.fsync = fsync
+        self.compress = compress
+        self.lines = []
+        self.raw_file = open(path, "ab")
+        self.gzip_file = None
+
+
+    def write_row(self, row):
+        """
+        Добавление записи в буфер
+
+        Arguments:
+        row -- запись (dict)
+        """
+        self.lines.append(json_dumps(row))
+        if len(self.lines) >= self.buffer_size:
+            self.flush()
+
+
+    def write_rows(self, rows):
+        """
+        Добавление записей в буфер
+
+        Arguments:
+        rows -- list записей (dict)
+        """
+        for row in rows:
+            self.write_row(row)
+
+
+    def flush(self):
+        """
+        Запись буфера в файл
+        """
+        if self.lines:
+            metrics.inc("rows_written_total", len(self.lines),
+                        format="ndjson.gz" if self.compress else "ndjson")
+            data = b"\n".join(self.lines) + b"\n"
+            self.lines.clear()
+            if self.compress:
+                if self.gzip_file is None:
+                    self.gzip_file = gzip.GzipFile(fileobj=self.raw_file, mode="wb")
+                self.gzip_file.write(data)
+            else:
+                self.raw_file.write(data)
+        self.raw_file.flush()
+
+
+    def checkpoint(self):
+        """
+        Запись буфера в файл, закрытие gzip блока и, если задано fsync, сброс на диск.
+        Возвращает размер файла в байтах
+        """
+        self.flush()
+        if self.gzip_file is not None:
+            self.gzip_file.close()
+            self.gzip_file = None
+            self.raw_file.flush()
+        if self.fsync:
+            os.fsync(self.raw_file.fileno())
+        return self.raw_file.tell()
+
+
+    def close(self):
+        """
+        Запись буфера и закрытие файла
+        """
+        if not self.raw_file.closed:
+            self.checkpoint()
+            self.raw_file.close()
+
+
+def open_stream_writer(path, file_format="csv", fsync=False):
+    """
+    Открытие буферизованной записи в файл записей
+
+    Arguments:
+    path -- путь к файлу
+    file_format -- формат файла: csv, ndjson или ndjson.gz
+    fsync -- сбрасывать файл на диск в контрольных точках
+    """
+    if file_format == "csv":
+        return CsvStreamWriter(path, fsync=fsync)
+    return NdjsonStreamWriter(path, compress=(file_format == "ndjson.gz"), fsync=fsync)
+
+
+def iterate_records(path, file_format=None):
+    """
+    Перебор записей файла записей в формате CSV, NDJSON или NDJSON.gz.
+    Записи CSV возвращаются как dict строк, записи NDJSON - как разобранный JSON
+
+    Arguments:
+    path -- путь к файлу
+    file_format -- формат файла, по умолчанию определяется по расширению
+    """
+    file_format = file_format or get_record_file_format(path)
+    if file_format != "csv":
+        opener = gzip.open if file_format == "ndjson.gz" else open
+        with opener(path, "rb") as f:
+            for line in f:
+                if line.strip():
+                    yield json_loads(line)
+    else:
+        with open(path, newline='', encoding='utf-8') as csv_file:
+            yield from csv.DictReader(csv_file)
+
+
+def merge_record_files(part_paths, path, file_format="csv"):
+    """
+    Объединение файлов записей одного формата в один файл. У CSV файлов
+    должны совпадать заголовки, NDJSON и gzip файлы объединяются конкатенацией
+
+    Arguments:
+    part_paths -- list путей к объединяемым файлам, отсутствующие и пустые файлы пропускаются
+    path -- путь к итоговому файлу, не создается, если все файлы пустые
+    file_format -- формат файлов: csv, ndjson или ndjson.gz
+    """
+    header = None
+    with open(path, 'wb') as f:
+        for part_path in part_paths:
+            if not os.path.exists(part_path):
+                continue
+            with open(part_path, 'rb') as part_file:
+                if file_format == "csv":
+                    part_header = part_file.readline()
+                    if part_header == b"":
+                        continue
+                    if header is None:
+                        header = part_header
+                        f.write(header)
+                    elif part_header != header:
+                        raise ValueError(f"CSV header of {part_path} differs from {part_paths[0]}")
+                shutil.copyfileobj(part_file, f)
+    if os.path.getsize(path) == 0:
+        os.remove(path)
+
+
+def find_record_files(prefix):
+    """
+    Получение файлов записей парсера в текущей директории вида
+    prefix_YYYYMMDD_HHMMSS.(csv|ndjson|ndjson.gz), отсортированных по времени парсинга
+
+    Arguments:
+    prefix -- префикс файлов (petitions, comments, signers)
+    """
+    pattern = re.compile("^" + prefix + r"_(\d{8}_\d{6})[.](csv|ndjson|ndjson[.]gz)$")
+    record_files = []
+    for f in os.listdir():
+        match = pattern.search(f)
+        if match and os.path.isfile(f):
+            record_files.append((datetime.datetime.strptime(match.group(1), "%Y%m%d_%H%M%S"), f))
+    record_files.sort()
+    return [f for _, f in record_files]
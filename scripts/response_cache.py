@@ -0,0 +1,125 @@
+import json
+import os
+import hashlib
+import threading
+import errno
+
+def silent_remove(filename):
+    try:
+        os.remove(filename)
+    except OSError as e:
+        if e.errno != errno.ENOENT:
+            raise
+
+
+class ResponseCache:
+    def __init__(self, directory, max_size=512 * 1024 * 1024):
+        """
+        Инициализация дискового кеша HTTP ответов с вытеснением давно
+        не использованных записей (LRU)
+
+        Arguments:
+        directory -- директория кеша
+        max_size -- максимальный размер кеша в байтах
+        """
+        self.directory = directory
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self.size = sum(f.stat().st_size for f in os.scandir(directory)
+                        if f.is_file() and f.name.endswith(".json"))
+
+
+    def get_entry_path(self, url):
+        """
+        Получение пути к файлу записи кеша
+
+        Arguments:
+        url -- полный адрес запроса вместе с параметрами
+        """
+        return os.path.join(self.directory, hashlib.sha256(url.encode("utf-8")).hexdigest() + ".json")
+
+
+    def get(self, url):
+        """
+        Получение записи кеша, None если записи нет. Запись содержит
+        etag, lastModified, hash и body ответа
+
+        Arguments:
+        url -- полный адрес запроса вместе с параметрами
+        """
+        entry_path = self.get_entry_path(url)
+        try:
+            with open(entry_path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+            os.utime(entry_path)
+        except (OSError, ValueError):
+            return None
+        return entry
+
+
+    def get_conditional_headers(self, entry):
+        """
+        Получение заголовков условного запроса для записи кеша
+
+        Arguments:
+        entry -- запись кеша, либо None
+        """
+        headers = {}
+        if entry is not None:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("lastModified"):
+                headers["If-Modified-Since"] = entry["lastModified"]
+        return headers
+
+
+    def put(self, url, headers, body, old_entry=None):
+        """
+        Сохранение ответа в кеш. Возвращает False, если содержимое ответа
+        совпадает с содержимым прежней записи кеша
+
+        Arguments:
+        url -- полный адрес запроса вместе с параметрами
+        headers -- заголовки ответа
+        body -- тело ответа (str)
+        old_entry -- прежняя запись кеша для этого адреса, либо None
+        """
+        body_hash = hashlib.sha256(body.encode("utf-8")).hexdigest()
+        entry = {"url": url,
+                 "etag": headers.get("ETag"),
+                 "lastModified": headers.get("Last-Modified"),
+                 "hash": body_hash,
+                 "body": body}
+        if old_entry is not None and all(old_entry.get(f) == entry[f]
+                                         for f in ("etag", "lastModified", "hash")):
+            return False
+
+        entry_path = self.get_entry_path(url)
+        tmp_path = f"{entry_path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(entry, f, ensure_ascii=False)
+        new_size = os.path.getsize(tmp_path)
+        with self.lock:
+            old_size = os.path.getsize(entry_path) if os.path.exists(entry_path) else 0
+            os.replace(tmp_path, entry_path)
+            self.size += new_size - old_size
+            if self.size > self.max_size:
+                self.evict()
+        return old_entry is None or old_entry.get("hash") != body_hash
+
+
+    def evict(self):
+        """
+        Удаление давно не использованных записей, пока размер кеша
+        не станет меньше max_size
+        """
+        entries = [f for f in os.scandir(self.directory)
+                   if f.is_file() and f.name.endswith(".json")]
+        entries.sort(key=lambda f: f.stat().st_mtime)
+        for entry in entries:
+            if self.size <= self.max_size:
+                break
+            size = entry.stat().st_size
+            silent_remove(entry.path)
+            self.size -= size
@@ -1,11 +1,16 @@
-import requests
 import json
-import csv
 from datetime import datetime
 from datetime import timedelta
 import os
 import itertools
 import errno
+from concurrent.futures import ProcessPoolExecutor
+from http_client import HttpClient, parse_concurrency
+from ordered_map import map_in_order
+from crawl_scheduler import CrawlScheduler
+from checkpoint_journal import CheckpointJournal, get_file_size, truncate_file
+from record_files import RECORD_FILE_FORMATS, get_record_file_format, open_stream_writer, merge_record_files
+from metrics import metrics
 
 def silent_remove(filename):
     try:
@@ -14,37 +19,114 @@ def silent_remove(filename):
         if e.errno != errno.ENOENT:
             raise
 
+def split_signers_block(offset, size):
+    """
+    Разбиение блока подписей [offset, offset + size) на блоки, которые можно
+    запросить одной страницей API: блок четного размера делится пополам,
+    нечетного - на блоки размером в степень двойки
+
+    Arguments:
+    offset -- позиция первой подписи блока, делится на size
+    size -- размер блока
+    """
+    if size % 2 == 0:
+        return [(offset, size // 2), (offset + size // 2, size // 2)]
+    blocks = []
+    end = offset + size
+    while offset < end:
+        block_size = offset & -offset if offset else 1 << ((end - offset).bit_length() - 1)
+        while offset + block_size > end:
+            block_size //= 2
+        blocks.append((offset, block_size))
+        offset += block_size
+    return blocks
+
 
 class SignersParser:
-    def __init__(self, api_url="https://epetition.kz/api/public/v1/petitions"):
+    def __init__(self, api_url="https://epetition.kz/api/public/v1/petitions", client=None, fsync=False, processes=1,
+                 concurrency=None, final_states=(), workers=1):
         """
         Инициализация парсера подписей
 
         Arguments:
         api_url -- API url для получения подписей
+        client -- HTTP клиент (HttpClient), по умолчанию создается новый
+        fsync -- сбрасывать файл записей на диск в контрольных точках
+        processes -- количество процессов, между которыми делятся петиции
+        concurrency -- dict максимального количества одновременных запросов по эндпоинтам
+                       в одном процессе; для запросов подписей, если не задано, используется workers
+        final_states -- состояния петиции, после которых она не меняется (CrawlScheduler)
+        workers -- количество петиций, подписи которых запрашиваются одновременно в одном процессе
         """
         self.api_url = api_url
-        self.timeout = 1
+        self.fsync = fsync
+        self.processes = processes
+        self.concurrency = concurrency
+        self.workers = workers
         self.max_page_size = 1
         self.headers = {
             'Accept': 'application/json',
             'Content-Type': 'application/json',
             'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_10_1) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/39.0.2171.95 Safari/537.36'
         }
+        self.client = client or HttpClient(headers=self.headers,
+                                           timeouts={"short": 3, "signers": 10},
+                                           pool_size=max(10, workers + 1),
+                                           concurrency={"signers": workers, **(concurrency or {})})
+        self.journal = CheckpointJournal("signers_parser.journal")
+        self.newest_created_dates = {}
+        self.signers_page_size = 100
+        self.scheduler = CrawlScheduler("petitions_catalog_of_signers.json",
+                                        closed_grace_period=timedelta(days=1),
+                                        final_states=final_states)
+        # позиции сбойных подписей отсчитываются от самой старой подписи петиции,
+        # поэтому не сдвигаются при появлении новых подписей, но сдвигаются при
+        # удалении подписей, поэтому через skipped_position_ttl проверяются заново
+        self.skipped_positions_path = "skipped_signers_positions.json"
+        self.skipped_position_ttl = timedelta(days=7)
+        self.skipped_positions = self.load_skipped_positions()
 
 
-    def get_new_signers_from_list(self, signers):
+    def load_skipped_positions(self):
+        """
+        Загрузка сбойных позиций подписей из JSON файла: dict id петиции -
+        dict позиции и времени, когда позиция оказалась сбойной. Позиции старше
+        skipped_position_ttl не загружаются и запрашиваются заново
+        """
+        try:
+            with open(self.skipped_positions_path, "r", encoding="utf-8") as f:
+                saved_positions = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        expired = (datetime.now() - self.skipped_position_ttl).isoformat()
+        skipped_positions = {}
+        for petition_id, positions in saved_positions.items():
+            # в файлах прежнего формата позиции хранились списком без времени
+            if not isinstance(positions, dict):
+                continue
+            positions = {position: skipped_at for position, skipped_at in positions.items()
+                         if skipped_at > expired}
+            if positions:
+                skipped_positions[petition_id] = positions
+        return skipped_positions
+
+
+    def get_new_signers_from_list(self, signers, since=None):
         """
         Получение новых подписей из списка
 
         Arguments:
         signers -- list подписей
+        since -- время, начиная с которого подписи считаются новыми,
+                 по умолчанию время прошлого парсинга
         """
+        if since is None:
+            since = self.last_parsing_datetime
         left, right = 0, len(signers)
         while left < right:
             mid = left + (right - left) // 2
             created_date = datetime.fromisoformat(signers[mid]["createdDate"][:19])
-            if created_date > self.last_parsing_datetime:
+            if created_date > since:
                 left = mid + 1
             else:
                 right = mid
@@ -63,68 +145,122 @@ class SignersParser:
                 "last": False if first_old_signer == len(signers) else True}
 
 
-    def fetch_new_signers(self, petition_id):
+    def fetch_signers_block(self, petition_id, offset, size, page_state):
+        """
+        Получение подписей с позиций [offset, offset + size) одной петиции из API.
+        offset должен делиться на size. При ошибке 500 блок делится на части,
+        пока сбойные подписи не будут найдены, сбойные позиции пропускаются
+
+        Arguments:
+        petition_id -- id петиции
+        offset -- позиция первой подписи блока
+        size -- размер блока
+        page_state -- dict состояния обхода петиции: total - общее количество
+                      подписей, last - достигнут конец списка, skipped - пропущенные позиции
+        """
+        total = page_state["total"]
+        if total is not None:
+            if offset >= total:
+                page_state["last"] = True
+                return []
+            bad_offsets = [total - 1 - int(f) for f in self.skipped_positions.get(petition_id, {})]
+            bad_offsets = [f for f in bad_offsets if offset <= f < offset + size]
+            if bad_offsets and size == 1:
+                page_state["skipped"].append(offset)
+                metrics.inc("signers_skipped_total")
+                return []
+            if bad_offsets:
+                return self.fetch_signers_blocks(petition_id, split_signers_block(offset, size),
+                                                 page_state)
+
+        response = self.client.get(f"{self.api_url}/{petition_id}/signers",
+                                   endpoint="signers",
+                                   params={"size":size, "page":offset // size},
+                                   allowed_statuses=(500,))
+        if response.status_code == 200:
+            signers_page = response.json()
+            if signers_page.get("totalElements") is not None:
+                page_state["total"] = signers_page["totalElements"]
+            if signers_page["last"]:
+                page_state["last"] = True
+            return signers_page["content"]
+
+        if size == 1:
+            page_state["skipped"].append(offset)
+            metrics.inc("signers_skipped_total")
+            return []
+        metrics.inc("signers_block_splits_total")
+        return self.fetch_signers_blocks(petition_id, split_signers_block(offset, size), page_state)
+
+
+    def fetch_signers_blocks(self, petition_id, blocks, page_state):
         """
-        Получение новых подписей одной петиции из API
+        Получение подписей нескольких блоков одной петиции по порядку
 
         Arguments:
         petition_id -- id петиции
+        blocks -- list пар (позиция первой подписи блока, размер блока)
+        page_state -- dict состояния обхода петиции
+        """
+        signers = []
+        for offset, size in blocks:
+            signers.extend(self.fetch_signers_block(petition_id, offset, size, page_state))
+        return signers
+
+
+    def fetch_new_signers(self, petition_id, since=None):
+        """
+        Получение новых подписей одной петиции из API: страницы запрашиваются,
+        пока не будет достигнута подпись не новее since либо конец списка
+
+        Arguments:
+        petition_id -- id петиции
+        since -- время, начиная с которого подписи считаются новыми,
+                 по умолчанию время прошлого парсинга
 
         INTERNAL_SERVER_ERROR:
         https://epetition.kz/api/public/v1/petitions/5e230abb-839e-4c35-ab68-83434354c8bf/signers?size=1&page=74
         """
+        if since is None:
+            since = self.last_parsing_datetime
+        page_size = self.signers_page_size
+        page_state = {"total": None, "last": False, "skipped": []}
         all_signers = []
         for i in itertools.count():
-            while True:
-                try:
-                    response = requests.get(f"{self.api_url}/{petition_id}/signers",
-                                            params={"size":100, "page":i},
-                                            headers=self.headers, timeout=3)
-                    if (response.status_code == 500): break
-                    response.raise_for_status()
-                    break
-                except (requests.exceptions.Timeout,
-                        requests.exceptions.ConnectionError):
-                    continue
-            
-            if response.status_code == 200:
-                signers = self.get_new_signers_from_list(response.json()["content"])
-                all_signers.extend(signers["content"])
-                if signers["last"]:
-                    break
-            elif response.status_code == 500:
-                for j in range(i * 100, (i + 1) * 100):
-                    while True:
-                        try:
-                            response = requests.get(f"{self.api_url}/{petition_id}/signers",
-                                                    params={"size":1, "page":j},
-                                                    headers=self.headers, timeout=3)
-                            if (response.status_code == 500): break
-                            response.raise_for_status()
-                            break
-                        except (requests.exceptions.Timeout,
-                                requests.exceptions.ConnectionError):
-                            continue
-                        
-                    if response.status_code == 200:
-                        created_date = datetime.fromisoformat(response.json()["content"][0]["createdDate"][:19])
-                        if created_date > self.new_last_parsing_datetime:
-                            continue
-                        if created_date <= self.last_parsing_datetime:
-                            break
-                        all_signers.extend(response.json()["content"])
-                        if response.json()["last"]: break
-
-            created_date = datetime.fromisoformat(response.json()["content"][0]["createdDate"][:19])
-            if response.json()["last"] or created_date <= self.last_parsing_datetime:
+            content = self.fetch_signers_block(petition_id, i * page_size, page_size, page_state)
+            signers = self.get_new_signers_from_list(content, since)
+            all_signers.extend(signers["content"])
+
+            total = page_state["total"]
+            if signers["last"] or page_state["last"]:
                 break
-            
+            if total is None and len(content) == 0:
+                break
+            if total is not None and (i + 1) * page_size >= total:
+                break
+
+        if page_state["skipped"] and page_state["total"] is not None:
+            positions = self.skipped_positions.setdefault(petition_id, {})
+            skipped_at = datetime.now().isoformat()
+            for offset in page_state["skipped"]:
+                positions.setdefault(str(page_state["total"] - 1 - offset), skipped_at)
+
         for signer in all_signers:
             signer["petitionId"] = petition_id
         
         return all_signers
 
 
+    def save_skipped_positions(self):
+        """
+        Сохранение сбойных позиций подписей в JSON файл
+        """
+        tmp_path = self.skipped_positions_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.skipped_positions, f)
+        os.replace(tmp_path, self.skipped_positions_path)
+
+
     def fetch_petition_list_page(self, size, page):
         """
         Получение страницы списка петиций из API
@@ -133,84 +269,298 @@ class SignersParser:
         size -- размер одной страницы списка
         page -- номер страницы списка
         """
-        while True:
-            try:
-                response = requests.get(f"{self.api_url}/short",
-                                        params={"size":size, "page":page},
-                                        headers=self.headers,
-                                        timeout=self.timeout)
-                response.raise_for_status()
-                break
-            except (requests.exceptions.Timeout,
-                    requests.exceptions.ConnectionError):
-                continue
+        response = self.client.get(f"{self.api_url}/short", endpoint="short",
+                                   params={"size":size, "page":page})
         return response.json()
 
 
-    def save_to_csv(self, signers, csv_path):
+    def fetch_petition_list(self):
+        """
+        Получение всего списка кратких петиций из API
+        """
+        short_petitions = []
+        for i in itertools.count():
+            petition_list_page = self.fetch_petition_list_page(self.max_page_size, i)
+            short_petitions.extend(petition_list_page["content"])
+            if petition_list_page["last"]:
+                break
+        return short_petitions
+
+
+    def fetch_petition_new_signers(self, short_petition, since):
         """
-        Сохранение подписей в CSV файл
+        Получение новых подписей петиции с учетом signersCount: если signersCount
+        не изменился с последнего обхода, запросы не выполняются. signersCount
+        не ограничивает количество страниц: подписи, добавленные после получения
+        списка петиций, занимают первые страницы, поэтому страницы запрашиваются
+        до подписи не новее since
 
         Arguments:
-        signers -- list подписей в формате json
-        csv_path -- Путь к CSV файлу
+        short_petition -- краткая петиция из списка петиций
+        since -- время, начиная с которого подписи считаются новыми
         """
-        if len(signers) == 0:
-            return
-        field_names = signers[0].keys()
-        
-        with open(csv_path, 'a', newline='', encoding='utf-8') as csv_file:
-            writer = csv.DictWriter(csv_file, fieldnames=field_names)
+        signers_count = short_petition.get("signersCount")
+        crawled_signers_count = self.scheduler.get_crawled_signers_count(short_petition["id"])
+        if signers_count is None or crawled_signers_count is None:
+            return self.fetch_new_signers(short_petition["id"], since)
+        if signers_count == crawled_signers_count:
+            return []
+        return self.fetch_new_signers(short_petition["id"], since)
 
-            if os.path.getsize(csv_path) == 0:
-                writer.writeheader()
-            writer.writerows(signers)
 
+    def crawl_petitions(self, planned_petitions, csv_path, journal, file_format="csv", sink=None):
+        """
+        Парсинг новых подписей запланированных петиций и сохранение в файле записей.
+        Подписи workers петиций запрашиваются одновременно, а записываются
+        в порядке плана. Количество обработанных петиций и размер файла сохраняются в журнал,
+        повторный вызов с тем же журналом продолжает парсинг с места остановки
+
+        Arguments:
+        planned_petitions -- list пар (краткая петиция, время, начиная с которого
+                             подписи считаются новыми)
+        csv_path -- Путь к файлу записей
+        journal -- журнал контрольных точек (CheckpointJournal)
+        file_format -- формат файла записей: csv, ndjson или ndjson.gz
+        sink -- приемник записей (pipeline.QueueSink) вместо файла записей
+        """
+        progress = journal.load()
+        if progress is None or (sink is None and not truncate_file(csv_path, progress["size"])):
+            silent_remove(csv_path)
+            progress = {"done": 0, "size": 0, "newest": {}}
+        done = progress["done"]
+        self.newest_created_dates.update(progress["newest"])
+        writer = sink if sink is not None else open_stream_writer(csv_path, file_format, fsync=self.fsync)
+        try:
+            planned_signers = map_in_order(
+                lambda planned: self.fetch_petition_new_signers(planned[0], planned[1]),
+                planned_petitions[done:], self.workers)
+            for (short_petition, _), signers in zip(planned_petitions[done:], planned_signers):
+                writer.write_rows(signers)
+                if signers:
+                    self.newest_created_dates[short_petition["id"]] = max(f["createdDate"][:19]
+                                                                          for f in signers)
+                done += 1
+                if journal.is_due():
+                    journal.save({"done": done, "size": writer.checkpoint(),
+                                  "newest": self.newest_created_dates})
+        finally:
+            journal.save({"done": done, "size": writer.checkpoint(),
+                          "newest": self.newest_created_dates})
+            writer.close()
+
+
+    def crawl_petitions_sharded(self, planned_petitions, csv_path, file_format="csv"):
+        """
+        Парсинг новых подписей запланированных петиций в нескольких процессах.
+        Каждый процесс пишет свой файл записей и журнал, после успешного завершения всех
+        процессов файлы объединяются в один. При сбое одной части остальные части
+        дорабатывают до конца, файлы частей сохраняются, и повторный вызов продолжает
+        парсинг каждой части с места остановки
+
+        Arguments:
+        planned_petitions -- list пар (краткая петиция, время, начиная с которого
+                             подписи считаются новыми)
+        csv_path -- Путь к файлу записей
+        file_format -- формат файла записей: csv, ndjson или ndjson.gz
+        """
+        shard_paths = self.get_shard_paths(csv_path)
+        with ProcessPoolExecutor(max_workers=self.processes) as executor:
+            futures = [executor.submit(crawl_signers_shard, self.api_url,
+                                       planned_petitions[k::self.processes],
+                                       self.last_parsing_datetime,
+                                       self.new_last_parsing_datetime,
+                                       shard_paths[k], file_format, self.fsync, self.concurrency,
+                                       self.workers)
+                       for k in range(self.processes)]
+
+        for future in futures:
+            if future.exception() is not None:
+                raise future.exception()
+        for future in futures:
+            skipped_positions, newest_created_dates, shard_metrics = future.result()
+            metrics.merge(shard_metrics)
+            self.skipped_positions.update(skipped_positions)
+            self.newest_created_dates.update(newest_created_dates)
+
+        with metrics.stage("signers_merge"):
+            merge_record_files(shard_paths, csv_path, file_format)
+        self.remove_shards(csv_path)
 
-    def run(self, csv_path):
+
+    def get_shard_paths(self, csv_path):
         """
-        Парсинг новых подписей, либо всех при первом запуске, и сохранение в CSV файле
+        Получение путей к файлам записей частей
+
+        Arguments:
+        csv_path -- Путь к файлу записей
+        """
+        return [f"{csv_path}.shard{k}" for k in range(self.processes)]
+
+
+    def remove_shards(self, csv_path):
+        """
+        Удаление файлов записей и журналов частей
+
+        Arguments:
+        csv_path -- Путь к файлу записей
+        """
+        for shard_path in self.get_shard_paths(csv_path):
+            silent_remove(shard_path)
+            silent_remove(shard_path + ".journal")
+
+
+    def get_resumable_csv_path(self):
+        """
+        Получение пути к файлу прерванного парсинга, None если его нет
+        """
+        state = self.journal.load()
+        return state["csvPath"] if state else None
+
+
+    def run(self, csv_path, sink=None):
+        """
+        Парсинг новых подписей, либо всех при первом запуске, и сохранение в файле записей.
+        Подписи пишутся во временный файл csv_path.part, план и прогресс парсинга
+        сохраняются в журнал, после сбоя повторный запуск с тем же csv_path продолжает
+        парсинг с места остановки. С приемником sink записи передаются загрузчику
+        базы данных вместо файла, а время последнего парсинга обновляется после их загрузки
         
         Arguments:
-        csv_path -- Путь к CSV файлу
+        csv_path -- Путь к файлу записей, с sink - имя запуска для журнала
+        sink -- приемник записей (pipeline.QueueSink) вместо файла записей,
+                петиции при этом парсятся в одном процессе
         """
-        try:
-            with open("last_parsing_of_signers.txt", "r") as f:
-                self.last_parsing_datetime = datetime.fromisoformat(f.read())
-        except:
-            self.last_parsing_datetime = datetime.fromisoformat("1900-01-01T00:00:00")   
-        self.new_last_parsing_datetime = datetime.now().replace(microsecond=0) - timedelta(seconds=1)
+        file_format = get_record_file_format(csv_path)
+        part_path = csv_path + ".part"
+        progress_journal = CheckpointJournal(part_path + ".journal")
+        state = self.journal.load()
+        if state is not None and state["csvPath"] == csv_path:
+            self.last_parsing_datetime = datetime.fromisoformat(state["lastParsingDatetime"])
+            self.new_last_parsing_datetime = datetime.fromisoformat(state["newLastParsingDatetime"])
+            planned_petitions = [(f["petition"], datetime.fromisoformat(f["since"]))
+                                 for f in state["plan"]]
+            self.processes = state["processes"]
+        else:
+            try:
+                with open("last_parsing_of_signers.txt", "r") as f:
+                    self.last_parsing_datetime = datetime.fromisoformat(f.read())
+            except:
+                self.last_parsing_datetime = datetime.fromisoformat("1900-01-01T00:00:00")   
+
+            silent_remove(part_path)
+            progress_journal.clear()
+            self.remove_shards(part_path)
+            with metrics.stage("signers_plan"):
+                short_petitions = self.fetch_petition_list()
+            # верхняя граница берется после получения списка, чтобы все записи,
+            # учтенные в signersCount списка, попали в текущий парсинг
+            self.new_last_parsing_datetime = datetime.now().replace(microsecond=0) - timedelta(seconds=1)
+            planned_petitions = self.scheduler.plan(short_petitions,
+                                                    self.last_parsing_datetime,
+                                                    self.new_last_parsing_datetime)
+            self.journal.save({"csvPath": csv_path,
+                              "lastParsingDatetime": self.last_parsing_datetime.isoformat(),
+                              "newLastParsingDatetime": self.new_last_parsing_datetime.isoformat(),
+                              "plan": [{"petition": short_petition, "since": since.isoformat()}
+                                       for short_petition, since in planned_petitions],
+                              "processes": self.processes})
         
         silent_remove(csv_path)
-        try:
-            for i in itertools.count():
-                petition_list_page = self.fetch_petition_list_page(self.max_page_size, i)
-
-                for short_petition in petition_list_page["content"]:
-                    signers = self.fetch_new_signers(short_petition["id"])
-                    self.save_to_csv(signers, csv_path)
-
-                if petition_list_page["last"]:
-                    break
-                
-            with open("last_parsing_of_signers.txt", "w") as f:
-                f.write(self.new_last_parsing_datetime.isoformat())
-        except:
-            silent_remove(csv_path)
-            raise
+        with metrics.stage("signers_crawl"):
+            if sink is not None:
+                self.crawl_petitions(planned_petitions, part_path, progress_journal, sink=sink)
+            elif self.processes > 1:
+                self.crawl_petitions_sharded(planned_petitions, part_path, file_format)
+            else:
+                self.crawl_petitions(planned_petitions, part_path, progress_journal, file_format)
+        if get_file_size(part_path) > 0:
+            os.replace(part_path, csv_path)
+        else:
+            silent_remove(part_path)
+
+        for short_petition, _ in planned_petitions:
+            self.scheduler.mark_crawled(short_petition["id"], self.new_last_parsing_datetime,
+                                        short_petition.get("signersCount"),
+                                        self.newest_created_dates.get(short_petition["id"]))
+        self.scheduler.save()
+        self.save_skipped_positions()
+        with open("last_parsing_of_signers.txt", "w") as f:
+            f.write(self.new_last_parsing_datetime.isoformat())
+        progress_journal.clear()
+        self.journal.clear()
+
+
+def crawl_signers_shard(api_url, planned_petitions, last_parsing_datetime,
+                        new_last_parsing_datetime, csv_path, file_format="csv", fsync=False,
+                        concurrency=None, workers=1):
+    """
+    Парсинг новых подписей части петиций в отдельном процессе.
+    Возвращает обновленные сбойные позиции подписей, время самых новых подписей петиций части и метрики процесса (Metrics.get_state)
+
+    Arguments:
+    api_url -- API url для получения подписей
+    planned_petitions -- list пар (краткая петиция, время, начиная с которого
+                         подписи считаются новыми)
+    last_parsing_datetime -- время прошлого парсинга
+    new_last_parsing_datetime -- время текущего парсинга
+    csv_path -- Путь к файлу записей части
+    file_format -- формат файла записей: csv, ndjson или ndjson.gz
+    fsync -- сбрасывать файл записей на диск в контрольных точках
+    concurrency -- dict максимального количества одновременных запросов по эндпоинтам
+    workers -- количество петиций, подписи которых запрашиваются одновременно
+    """
+    metrics.reset()
+    parser = SignersParser(api_url, fsync=fsync, concurrency=concurrency, workers=workers)
+    parser.last_parsing_datetime = last_parsing_datetime
+    parser.new_last_parsing_datetime = new_last_parsing_datetime
+    parser.crawl_petitions(planned_petitions, csv_path, CheckpointJournal(csv_path + ".journal"),
+                           file_format)
+
+    petition_ids = {short_petition["id"] for short_petition, _ in planned_petitions}
+    skipped_positions = {petition_id: positions
+                         for petition_id, positions in parser.skipped_positions.items()
+                         if petition_id in petition_ids}
+    return skipped_positions, parser.newest_created_dates, metrics.get_state()
 
 
 if __name__ == "__main__":
     import argparse
     arg_parser = argparse.ArgumentParser(prog="signers parser")
     arg_parser.add_argument("-f", "--filename")
+    arg_parser.add_argument("--format", choices=RECORD_FILE_FORMATS, default="csv",
+                            help="формат файла записей")
+    arg_parser.add_argument("--concurrency", type=parse_concurrency, action="append", default=[],
+                            metavar="signers=N",
+                            help="максимальное количество одновременных запросов подписей в одном процессе, "
+                                 "количество подбирается по ответам сервера, по умолчанию -w")
+    arg_parser.add_argument("-w", "--workers", type=int, default=4,
+                            help="количество петиций, подписи которых запрашиваются одновременно в одном процессе")
+    arg_parser.add_argument("--final-state", action="append", default=[],
+                            help="состояние петиции, после которого она не меняется и обходится редко, "
+                                 "можно указать несколько раз; без него петиции закрываются по deadline")
+    arg_parser.add_argument("--fsync", action="store_true",
+                            help="сбрасывать файл записей на диск в контрольных точках")
+    arg_parser.add_argument("-p", "--processes", type=int, default=1,
+                            help="количество процессов, между которыми делятся петиции")
+    arg_parser.add_argument("--metrics-file",
+                            help="файл метрик, сохраняемый в конце запуска: .json - JSON сводка, иначе формат Prometheus")
+    arg_parser.add_argument("--metrics-stages", action="store_true",
+                            help="добавлять в файл метрик время этапов запуска")
     args = arg_parser.parse_args()
+    if set(dict(args.concurrency)) - {"signers"}:
+        arg_parser.error("--concurrency: only signers requests are sent concurrently")
+    if args.metrics_file:
+        metrics.save_at_exit(args.metrics_file, stages=args.metrics_stages)
     
-    parser = SignersParser()
+    parser = SignersParser(processes=args.processes, fsync=args.fsync,
+                           concurrency=dict(args.concurrency), final_states=args.final_state,
+                           workers=args.workers)
 
     if args.filename:
-        parser.run(f"{args.filename}.csv")
+        parser.run(f"{args.filename}.{args.format}")
+    elif parser.get_resumable_csv_path():
+        parser.run(parser.get_resumable_csv_path())
     else:
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        parser.run(f"signers_{timestamp}.csv")
+        parser.run(f"signers_{timestamp}.{args.format}")
 